@@ -1,25 +1,167 @@
 """
 `pip install cryptography`
 
+Deriving the key takes 100,000 rounds of SHA256, so derived keys are kept in a small
+process-wide LRU cache. Making another AESCipher with the same key/salt/iterations is then free.
+
+encrypt_stream()/decrypt_stream() (and the encrypt_file()/decrypt_file() helpers) work through
+files of any size in fixed size chunks. Their output is raw binary, IV + ciphertext, which is
+the same as encrypt()'s CBC output before it is base64 encoded. Streams always use CBC.
+
+encrypt_many()/decrypt_many() handle lots of small values (e.g. database fields) in one call,
+optionally spread over a process pool. Pass executor= to reuse one pool across many calls:
+
+with ProcessPoolExecutor(4) as pool:
+    for batch in batches:
+        encrypted = aes.encrypt_many(batch, chunk_size=2_500, executor=pool)
+
+mode="gcm" uses AES-GCM instead of AES-CBC. It needs no padding, is hardware accelerated and
+authenticated (tampered data fails to decrypt instead of giving garbage). The output is a compact envelope:
+    "GCM" | version (1 byte) | nonce (12 bytes) | tag (16 bytes) | ciphertext (same length as the plaintext)
+decrypt() still reads old CBC values, so existing data doesn't need re-encrypting.
+
+Only a cipher in mode="gcm" (or made with read_gcm=True) looks for GCM envelopes at all, so a cipher
+left in the default mode decrypts exactly what it always did. Old CBC values have a random IV, so
+about 1 in 4 billion starts with the envelope prefix, decrypt_legacy() reads those.
+
+Key derivation and encrypt()/decrypt() report their timings to Metrics.metrics when it is enabled.
+Metrics.py doesn't have to be copied along, without it nothing is timed.
+Pass raw=True to encrypt()/decrypt() to skip base64 and store the bytes directly (about 25% smaller).
 """
 
 from cryptography.hazmat.primitives import hashes, padding
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.exceptions import InvalidTag
 from cryptography.hazmat.backends import default_backend
+from collections import OrderedDict
+import hashlib
 import os
 import base64
+import itertools
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+
+try:
+    from Metrics import metrics
+except ImportError:
+    # Metrics.py is optional
+    class _NoMetrics:
+        enabled = False
+
+        def count(self, name, value=1, **tags):
+            pass
+
+        def observe(self, name, value, **tags):
+            pass
+
+        def span(self, name, **tags):
+            return nullcontext()
+
+    metrics = _NoMetrics()
+
+# PKCS7 padding for every possible pad length
+_PADS = [bytes([n]) * n for n in range(17)]
+
+# A GCM envelope starts with GCM_MAGIC + GCM_VERSION, followed by the 12 byte nonce and 16 byte tag
+GCM_MAGIC = b"GCM"
+GCM_VERSION = b"\x01"
+_GCM_PREFIX = GCM_MAGIC + GCM_VERSION
+_GCM_HEADER = len(_GCM_PREFIX) + 12 + 16
+
+
+def _cbc_iv(iv: bytes = None) -> bytes:
+    """Random CBC IV that never starts with the GCM envelope prefix, so new CBC values can't be taken for one."""
+    iv = iv or os.urandom(16)
+    while iv[:len(_GCM_PREFIX)] == _GCM_PREFIX:
+        iv = os.urandom(16)
+    return iv
+
+
+def _encrypt_chunk(key: bytes, settings: tuple, items: list, offset: int, errors: str, raw: bool) -> list:
+    return AESCipher.from_key(key, *settings)._encrypt_batch(items, offset, errors, raw)
+
+
+def _decrypt_chunk(key: bytes, settings: tuple, items: list, offset: int, errors: str, raw: bool) -> list:
+    return AESCipher.from_key(key, *settings)._decrypt_batch(items, offset, errors, raw)
 
 class AESCipher:
-    def __init__(self, key: bytes, salt: bytes, iterations: int = 100_000):
+    # (sha256 of password, salt, iterations) -> derived key, most recently used last
+    _key_cache = OrderedDict()
+    _key_cache_lock = threading.Lock()
+    key_cache_size = 128
+
+    def __init__(self, key: bytes, salt: bytes, iterations: int = 100_000, use_cache: bool = True,
+                 mode: str = "cbc", allow_legacy_cbc: bool = True, read_gcm: bool = False):
         """
         Initialize the cipher with a password-based key derivation using SHA256.
         :param key: The user-provided key (e.g., a password or secret).
         :param salt: A salt for KDF (must be securely generated and saved).
         :param iterations: Number of iterations for key derivation.
+        :param use_cache: Reuse a previously derived key for the same key/salt/iterations.
+        :param mode: "cbc" or "gcm", the mode encrypt() uses. In "gcm" decrypt() reads both.
+        :param allow_legacy_cbc: Let decrypt() read CBC values. Turn off once all data is GCM
+                                 so only authenticated values are accepted.
+        :param read_gcm: Let a "cbc" cipher's decrypt() read GCM envelopes too, e.g. while readers
+                         are switched over before the writers. Off, it only ever reads CBC.
         """
         self.backend = default_backend()
-        self.key = self._derive_key(key, salt, iterations)
+        if use_cache:
+            self.key = self._cached_derive_key(key, salt, iterations)
+        else:
+            self.key = self._derive_key(key, salt, iterations)
+        self._setup(mode, allow_legacy_cbc, read_gcm)
+
+    @classmethod
+    def from_key(cls, raw_key: bytes, mode: str = "cbc", allow_legacy_cbc: bool = True, read_gcm: bool = False):
+        """
+        Creates a cipher from an already derived 16, 24 or 32 byte AES key (e.g. another instance's .key),
+        skipping key derivation entirely.
+        """
+        if len(raw_key) not in (16, 24, 32):
+            raise ValueError(f"Invalid AES key length: {len(raw_key)} bytes, expected 16, 24 or 32")
+        cipher = cls.__new__(cls)
+        cipher.backend = default_backend()
+        cipher.key = bytes(raw_key)
+        cipher._setup(mode, allow_legacy_cbc, read_gcm)
+        return cipher
+
+    @classmethod
+    def clear_key_cache(cls):
+        with cls._key_cache_lock:
+            cls._key_cache.clear()
+
+    def _setup(self, mode: str, allow_legacy_cbc: bool, read_gcm: bool):
+        if mode not in ("cbc", "gcm"):
+            raise ValueError(f"Unknown mode {mode!r}, expected 'cbc' or 'gcm'")
+        self.mode = mode
+        self.allow_legacy_cbc = allow_legacy_cbc
+        self.read_gcm = read_gcm or mode == "gcm"
+        if not (self.read_gcm or allow_legacy_cbc):
+            raise ValueError("allow_legacy_cbc=False needs mode='gcm' or read_gcm=True, nothing could be decrypted")
+        # Built once and shared by every encrypt/decrypt call
+        self._algorithm = algorithms.AES(self.key)
+        self._padding = padding.PKCS7(128)
+        self._aesgcm = AESGCM(self.key)
+
+    def _cached_derive_key(self, password: bytes, salt: bytes, iterations: int) -> bytes:
+        # Only a hash of the password is kept as the cache key
+        cache_key = (hashlib.sha256(password).digest(), bytes(salt), iterations)
+        with self._key_cache_lock:
+            key = self._key_cache.get(cache_key)
+            if key is not None:
+                self._key_cache.move_to_end(cache_key)
+                metrics.count("aes.key_cache_hits")
+                return key
+
+        key = self._derive_key(password, salt, iterations)
+        with self._key_cache_lock:
+            self._key_cache[cache_key] = key
+            while len(self._key_cache) > self.key_cache_size:
+                self._key_cache.popitem(last=False)
+        return key
 
     def _derive_key(self, password: bytes, salt: bytes, iterations: int) -> bytes:
         kdf = PBKDF2HMAC(
@@ -29,39 +171,314 @@ class AESCipher:
             iterations=iterations,
             backend=self.backend
         )
-        return kdf.derive(password)
+        with metrics.span("aes.kdf", iterations=iterations):
+            return kdf.derive(password)
 
-    def encrypt(self, plaintext: bytes) -> bytes:
-        iv = os.urandom(16)
-        padder = padding.PKCS7(128).padder()
-        padded_data = padder.update(plaintext) + padder.finalize()
+    def encrypt(self, plaintext: bytes, raw: bool = False) -> bytes:
+        """
+        :param plaintext: Bytes to encrypt.
+        :param raw: Return the encrypted bytes as they are instead of base64 encoding them.
+        """
+        with metrics.span("aes.encrypt", mode=self.mode):
+            if self.mode == "gcm":
+                data = self._encrypt_gcm(plaintext)
+            else:
+                iv = _cbc_iv()
+                padder = self._padding.padder()
+                padded_data = padder.update(plaintext) + padder.finalize()
+
+                cipher = Cipher(self._algorithm, modes.CBC(iv), backend=self.backend)
+                encryptor = cipher.encryptor()
+                ciphertext = encryptor.update(padded_data) + encryptor.finalize()
+                data = iv + ciphertext
 
-        cipher = Cipher(algorithms.AES(self.key), modes.CBC(iv), backend=self.backend)
-        encryptor = cipher.encryptor()
-        ciphertext = encryptor.update(padded_data) + encryptor.finalize()
+        return data if raw else base64.b64encode(data)
 
-        return base64.b64encode(iv + ciphertext)
+    def _encrypt_gcm(self, plaintext: bytes, nonce: bytes = None) -> bytes:
+        nonce = nonce or os.urandom(12)
+        # AESGCM gives ciphertext + tag, the envelope stores the tag first
+        sealed = self._aesgcm.encrypt(nonce, plaintext, None)
+        return b"".join((_GCM_PREFIX, nonce, sealed[-16:], sealed[:-16]))
 
-    def decrypt(self, encrypted_data: bytes) -> bytes:
+    def decrypt(self, encrypted_data: bytes, raw: bool = False) -> bytes:
+        """
+        Decrypts CBC values (unless allow_legacy_cbc is off) and, in mode="gcm" or with read_gcm, GCM envelopes.
+
+        :param encrypted_data: Output of encrypt().
+        :param raw: encrypted_data is raw bytes from encrypt(raw=True) rather than base64.
+        """
         try:
-            raw = base64.b64decode(encrypted_data)
-            if len(raw) < 16:
+            data = encrypted_data if raw else base64.b64decode(encrypted_data)
+            with metrics.span("aes.decrypt"):
+                return self._decrypt_data(data)
+
+        except Exception as e:
+            raise ValueError(f"Decryption failed: {str(e)}")
+
+    def _decrypt_data(self, data: bytes) -> bytes:
+        if self.read_gcm and data[:len(_GCM_PREFIX)] == _GCM_PREFIX and len(data) >= _GCM_HEADER:
+            nonce_end = len(_GCM_PREFIX) + 12
+            try:
+                return self._aesgcm.decrypt(data[len(_GCM_PREFIX):nonce_end],
+                                            data[_GCM_HEADER:] + data[nonce_end:_GCM_HEADER], None)
+            except InvalidTag:
+                # Never retried as CBC, that would hand back garbage for tampered GCM values.
+                # The odd old CBC value that looks like an envelope has to go through decrypt_legacy()
+                raise ValueError("Invalid encrypted data: authentication failed") from None
+        if not self.allow_legacy_cbc:
+            raise ValueError("Invalid encrypted data: not a GCM envelope")
+        return self._decrypt_cbc(data)
+
+    def decrypt_legacy(self, encrypted_data: bytes, raw: bool = False) -> bytes:
+        """
+        Decrypts encrypted_data as a CBC value, without checking for a GCM envelope first.
+        For old CBC values whose IV happens to start with the GCM envelope prefix, which decrypt() rejects
+        in mode="gcm" or with read_gcm.
+        CBC is not authenticated, so only use it on values known to be CBC.
+
+        :param encrypted_data: CBC output of encrypt().
+        :param raw: encrypted_data is raw bytes from encrypt(raw=True) rather than base64.
+        """
+        try:
+            data = encrypted_data if raw else base64.b64decode(encrypted_data)
+            return self._decrypt_cbc(data)
+        except Exception as e:
+            raise ValueError(f"Decryption failed: {str(e)}")
+
+    def _decrypt_cbc(self, raw: bytes) -> bytes:
+        if len(raw) < 16:
+            raise ValueError("Invalid encrypted data: too short for IV")
+
+        iv = raw[:16]
+        ciphertext = raw[16:]
+
+        cipher = Cipher(self._algorithm, modes.CBC(iv), backend=self.backend)
+        decryptor = cipher.decryptor()
+        padded_plaintext = decryptor.update(ciphertext) + decryptor.finalize()
+
+        unpadder = self._padding.unpadder()
+        plaintext = unpadder.update(padded_plaintext) + unpadder.finalize()
+        return plaintext
+
+    @staticmethod
+    def _read_chunks(src, buffer: bytearray):
+        """Yields views into `buffer` filled from src, reusing the one buffer for every chunk."""
+        view = memoryview(buffer)
+        readinto = getattr(src, "readinto", None)
+        while True:
+            if readinto is not None:
+                size = readinto(buffer)
+                if not size:
+                    return
+                yield view[:size]
+            else:
+                data = src.read(len(buffer))
+                if not data:
+                    return
+                yield data
+
+    def encrypt_stream(self, src, dst, chunk_size: int = 64 * 1024) -> int:
+        """
+        Encrypts everything read from src into dst, chunk_size bytes at a time, so memory use doesn't
+        depend on the size of the data.
+
+        :param src: Binary file-like object to read plaintext from.
+        :param dst: Binary file-like object to write IV + ciphertext to.
+        :param chunk_size: Bytes read per chunk.
+        :return written: Number of bytes written to dst.
+        """
+        iv = _cbc_iv()
+        encryptor = Cipher(self._algorithm, modes.CBC(iv), backend=self.backend).encryptor()
+        buffer = bytearray(chunk_size)
+        out = bytearray(chunk_size + 15)  # update_into needs room for a block held over from the last chunk
+        out_view = memoryview(out)
+
+        dst.write(iv)
+        written = len(iv)
+        total = 0
+        for chunk in self._read_chunks(src, buffer):
+            total += len(chunk)
+            size = encryptor.update_into(chunk, out)
+            dst.write(out_view[:size])
+            written += size
+
+        # PKCS7: pad with n bytes of value n to the next block boundary
+        pad = 16 - total % 16
+        tail = encryptor.update(bytes([pad]) * pad) + encryptor.finalize()
+        dst.write(tail)
+        return written + len(tail)
+
+    def decrypt_stream(self, src, dst, chunk_size: int = 64 * 1024) -> int:
+        """
+        Decrypts IV + ciphertext (from encrypt_stream(), or base64 decoded encrypt() output) read from src into dst,
+        chunk_size bytes at a time.
+
+        :param src: Binary file-like object to read IV + ciphertext from.
+        :param dst: Binary file-like object to write the plaintext to.
+        :param chunk_size: Bytes read per chunk.
+        :return written: Number of bytes written to dst.
+        """
+        try:
+            iv = src.read(16)
+            if len(iv) < 16:
                 raise ValueError("Invalid encrypted data: too short for IV")
 
-            iv = raw[:16]
-            ciphertext = raw[16:]
+            decryptor = Cipher(self._algorithm, modes.CBC(iv), backend=self.backend).decryptor()
+            buffer = bytearray(chunk_size)
+            out = bytearray(chunk_size + 15)
+            out_view = memoryview(out)
 
-            cipher = Cipher(algorithms.AES(self.key), modes.CBC(iv), backend=self.backend)
-            decryptor = cipher.decryptor()
-            padded_plaintext = decryptor.update(ciphertext) + decryptor.finalize()
+            # The last block holds the padding, so one block is always held back until the end
+            held = b""
+            written = 0
+            for chunk in self._read_chunks(src, buffer):
+                size = decryptor.update_into(chunk, out)
+                if not size:
+                    continue
+                dst.write(held)
+                dst.write(out_view[:size - 16])
+                written += len(held) + size - 16
+                held = bytes(out_view[size - 16:size])
+            decryptor.finalize()
+            if not held:
+                raise ValueError("Invalid encrypted data: no ciphertext")
 
-            unpadder = padding.PKCS7(128).unpadder()
-            plaintext = unpadder.update(padded_plaintext) + unpadder.finalize()
-            return plaintext
+            unpadder = self._padding.unpadder()
+            tail = unpadder.update(held) + unpadder.finalize()
+            dst.write(tail)
+            return written + len(tail)
 
         except Exception as e:
             raise ValueError(f"Decryption failed: {str(e)}")
 
+    def encrypt_file(self, src_path: str, dst_path: str, chunk_size: int = 1024 * 1024) -> int:
+        """Encrypts the file at src_path into dst_path, see encrypt_stream()."""
+        with open(src_path, "rb") as src, open(dst_path, "wb") as dst:
+            return self.encrypt_stream(src, dst, chunk_size)
+
+    def decrypt_file(self, src_path: str, dst_path: str, chunk_size: int = 1024 * 1024) -> int:
+        """Decrypts the file at src_path into dst_path, see decrypt_stream(). dst_path is removed if it fails."""
+        try:
+            with open(src_path, "rb") as src, open(dst_path, "wb") as dst:
+                return self.decrypt_stream(src, dst, chunk_size)
+        except ValueError:
+            os.remove(dst_path)
+            raise
+
+    def _encrypt_batch(self, items: list, offset: int = 0, errors: str = "raise", raw: bool = False) -> list:
+        # Same output as encrypt(), with the per call lookups and the padder hoisted out of the loop
+        algorithm = self._algorithm
+        backend = self.backend
+        encode = (lambda data: data) if raw else base64.b64encode
+        gcm = self.mode == "gcm"
+        iv_size = 12 if gcm else 16
+        ivs = os.urandom(iv_size * len(items))
+        results = []
+        for i, plaintext in enumerate(items):
+            try:
+                iv = ivs[i * iv_size:(i + 1) * iv_size]
+                if gcm:
+                    results.append(encode(self._encrypt_gcm(plaintext, iv)))
+                    continue
+                iv = _cbc_iv(iv)
+                encryptor = Cipher(algorithm, modes.CBC(iv), backend=backend).encryptor()
+                ciphertext = encryptor.update(plaintext + _PADS[16 - len(plaintext) % 16]) + encryptor.finalize()
+                results.append(encode(iv + ciphertext))
+            except Exception as e:
+                error = ValueError(f"Encryption failed for item {offset + i}: {str(e)}")
+                if errors == "raise":
+                    raise error
+                results.append(error)
+        return results
+
+    def _decrypt_batch(self, items: list, offset: int = 0, errors: str = "raise", raw: bool = False) -> list:
+        algorithm = self._algorithm
+        backend = self.backend
+        decode = (lambda data: data) if raw else base64.b64decode
+        results = []
+        for i, encrypted_data in enumerate(items):
+            try:
+                raw_data = decode(encrypted_data)
+                if (self.read_gcm and raw_data[:len(_GCM_PREFIX)] == _GCM_PREFIX) or not self.allow_legacy_cbc:
+                    results.append(self._decrypt_data(raw_data))
+                    continue
+                if len(raw_data) < 32 or len(raw_data) % 16:
+                    raise ValueError("Invalid encrypted data: wrong length")
+                decryptor = Cipher(algorithm, modes.CBC(raw_data[:16]), backend=backend).decryptor()
+                padded_plaintext = decryptor.update(raw_data[16:]) + decryptor.finalize()
+                pad = padded_plaintext[-1]
+                if not 1 <= pad <= 16 or padded_plaintext[-pad:] != _PADS[pad]:
+                    raise ValueError("Invalid padding bytes.")
+                results.append(padded_plaintext[:-pad])
+            except Exception as e:
+                error = ValueError(f"Decryption failed for item {offset + i}: {str(e)}")
+                if errors == "raise":
+                    raise error
+                results.append(error)
+        return results
+
+    def _run_many(self, batch, worker, items, workers, chunk_size, errors, raw, executor=None) -> list:
+        if errors not in ("raise", "return"):
+            raise ValueError(f"errors must be 'raise' or 'return', not {errors!r}")
+        items = list(items)
+        if not (workers or executor) or len(items) <= chunk_size:
+            return batch(items, 0, errors, raw)
+
+        offsets = range(0, len(items), chunk_size)
+        chunks = [items[offset:offset + chunk_size] for offset in offsets]
+        if executor is None:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                return self._map_chunks(executor, worker, chunks, offsets, errors, raw)
+        return self._map_chunks(executor, worker, chunks, offsets, errors, raw)
+
+    def _map_chunks(self, executor, worker, chunks, offsets, errors, raw) -> list:
+        # map keeps the chunks in order
+        settings = (self.mode, self.allow_legacy_cbc, self.read_gcm)
+        results = executor.map(worker, itertools.repeat(self.key), itertools.repeat(settings), chunks, offsets,
+                               itertools.repeat(errors), itertools.repeat(raw))
+        return list(itertools.chain.from_iterable(results))
+
+    def encrypt_many(self, items, workers: int = None, chunk_size: int = 10_000, errors: str = "raise",
+                     raw: bool = False, executor: ProcessPoolExecutor = None) -> list:
+        """
+        Encrypts lots of values in one go, giving the same output as calling encrypt() on each.
+
+        e.g.
+            encrypted = aes.encrypt_many(row[2] for row in db.iter_sql("SELECT * FROM Clients"))
+
+        :param items: Iterable of bytes to encrypt.
+        :param workers: Spread batches bigger than chunk_size over this many processes. None keeps it in process.
+        :param chunk_size: Items sent to a worker process at a time.
+        :param errors: "raise" to raise a ValueError naming the first item that failed,
+                       "return" to put the ValueError in that item's place and carry on.
+        :param raw: Give raw bytes instead of base64, like encrypt(raw=True).
+        :param executor: ProcessPoolExecutor to spread batches bigger than chunk_size over instead of
+                         starting a new one with workers. Keep one open when calling this over and over
+                         (e.g. per batch of a job) so the processes are only started once.
+        :return results: List of base64 encrypted values, in the same order as items.
+        """
+        with metrics.span("aes.encrypt_many", mode=self.mode):
+            return self._run_many(self._encrypt_batch, _encrypt_chunk, items, workers, chunk_size, errors, raw,
+                                  executor)
+
+    def decrypt_many(self, items, workers: int = None, chunk_size: int = 10_000, errors: str = "raise",
+                     raw: bool = False, executor: ProcessPoolExecutor = None) -> list:
+        """
+        Decrypts lots of values from encrypt()/encrypt_many() in one go.
+
+        :param items: Iterable of base64 encrypted values.
+        :param workers: Spread batches bigger than chunk_size over this many processes. None keeps it in process.
+        :param chunk_size: Items sent to a worker process at a time.
+        :param errors: "raise" to raise a ValueError naming the first item that failed,
+                       "return" to put the ValueError in that item's place and carry on.
+        :param raw: items are raw bytes from encrypt(raw=True) rather than base64.
+        :param executor: ProcessPoolExecutor to use instead of starting one, see encrypt_many().
+        :return results: List of plaintext bytes, in the same order as items.
+        """
+        with metrics.span("aes.decrypt_many"):
+            return self._run_many(self._decrypt_batch, _decrypt_chunk, items, workers, chunk_size, errors, raw,
+                                  executor)
+
 # Example usage
 if __name__ == "__main__":
     key = b'08180230818209389012832132109123'
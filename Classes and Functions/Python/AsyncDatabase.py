@@ -0,0 +1,499 @@
+"""
+asyncio version of DatabaseConnector, queries await instead of blocking the event loop
+so lots of them can be in flight at once from one process.
+
+`pip install aiomysql` for mysql
+`pip install asyncpg` for postgresql (uses $1, $2 placeholders instead of %s)
+sqlite needs nothing extra, sqlite3 is run on a worker thread. Handy for testing.
+"""
+
+import asyncio
+import sqlite3
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from Database import Row
+
+
+class _AioMySQLConnection:
+    def __init__(self, connection):
+        self.connection = connection
+
+    async def is_alive(self):
+        await self.connection.ping(reconnect=False)
+        return True
+
+    async def begin(self):
+        pass
+
+    async def commit(self):
+        await self.connection.commit()
+
+    async def rollback(self):
+        await self.connection.rollback()
+
+    async def close(self):
+        await self.connection.ensure_closed()
+
+    async def fetch(self, sql, params):
+        async with self.connection.cursor() as cursor:
+            await cursor.execute(sql, params)
+            rows = await cursor.fetchall()
+            columns = tuple(desc[0] for desc in cursor.description or ())
+            return columns, list(rows)
+
+    async def iterate(self, sql, params, batch_size):
+        import aiomysql
+        async with self.connection.cursor(aiomysql.SSCursor) as cursor:
+            await cursor.execute(sql, params)
+            columns = tuple(desc[0] for desc in cursor.description or ())
+            while True:
+                batch = await cursor.fetchmany(batch_size)
+                if not batch:
+                    return
+                yield columns, batch
+
+
+class _AsyncpgConnection:
+    def __init__(self, connection):
+        self.connection = connection
+        self.transaction = None
+
+    async def is_alive(self):
+        await self.connection.execute("SELECT 1")
+        return True
+
+    async def begin(self):
+        # asyncpg autocommits unless a transaction is open, and server side cursors need one
+        self.transaction = self.connection.transaction()
+        await self.transaction.start()
+
+    async def commit(self):
+        transaction, self.transaction = self.transaction, None
+        if transaction is not None:
+            await transaction.commit()
+
+    async def rollback(self):
+        transaction, self.transaction = self.transaction, None
+        if transaction is not None:
+            await transaction.rollback()
+
+    async def close(self):
+        await self.connection.close()
+
+    async def fetch(self, sql, params):
+        records = await self.connection.fetch(sql, *(params or ()))
+        columns = tuple(records[0].keys()) if records else ()
+        return columns, [tuple(record) for record in records]
+
+    async def iterate(self, sql, params, batch_size):
+        cursor = await self.connection.cursor(sql, *(params or ()))
+        while True:
+            records = await cursor.fetch(batch_size)
+            if not records:
+                return
+            yield tuple(records[0].keys()), [tuple(record) for record in records]
+
+
+class _SQLiteConnection:
+    def __init__(self, connection):
+        self.connection = connection
+
+    async def is_alive(self):
+        return True
+
+    async def begin(self):
+        pass
+
+    async def commit(self):
+        await asyncio.to_thread(self.connection.commit)
+
+    async def rollback(self):
+        await asyncio.to_thread(self.connection.rollback)
+
+    async def close(self):
+        await asyncio.to_thread(self.connection.close)
+
+    def _fetch(self, sql, params):
+        cursor = self.connection.execute(sql, params or ())
+        try:
+            rows = cursor.fetchall()
+            return tuple(desc[0] for desc in cursor.description or ()), rows
+        finally:
+            cursor.close()
+
+    async def fetch(self, sql, params):
+        return await asyncio.to_thread(self._fetch, sql, params)
+
+    async def iterate(self, sql, params, batch_size):
+        cursor = await asyncio.to_thread(self.connection.execute, sql, params or ())
+        try:
+            columns = tuple(desc[0] for desc in cursor.description or ())
+            while True:
+                batch = await asyncio.to_thread(cursor.fetchmany, batch_size)
+                if not batch:
+                    return
+                yield columns, batch
+        finally:
+            cursor.close()
+
+
+class AsyncConnectionPool:
+    """
+    Bounded asyncio pool of database connections, the async twin of Database.ConnectionPool.
+
+    New connections are made with the `connect` coroutine until max_size are open, after that
+    borrowers wait up to `timeout` seconds for one to be released.
+    Connections idle for longer than idle_timeout are closed (never going below min_size)
+    and ones idle for longer than check_after are health checked before being handed out.
+    """
+
+    def __init__(self, connect, min_size=1, max_size=10, timeout=30.0, idle_timeout=300.0, check_after=30.0):
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ValueError(f"Invalid pool size: min_size={min_size}, max_size={max_size}")
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.check_after = check_after
+
+        self._condition = asyncio.Condition()
+        self._idle = deque()  # (connection, last_used), oldest on the left
+        self._size = 0
+        self._in_use = 0
+        self._closed = False
+
+        self._created = 0
+        self._recycled = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._max_wait_time = 0.0
+
+    async def open(self):
+        """Opens min_size connections up front."""
+        connections = await asyncio.gather(*(self._new_connection() for _ in range(self.min_size)))
+        async with self._condition:
+            now = time.monotonic()
+            self._idle.extend((connection, now) for connection in connections)
+            self._size += len(connections)
+        return self
+
+    async def _new_connection(self):
+        connection = await self._connect()
+        self._created += 1
+        return connection
+
+    @staticmethod
+    async def _close_quietly(connection):
+        try:
+            await connection.close()
+        except Exception:
+            pass
+
+    async def _alive(self, connection):
+        try:
+            return bool(await connection.is_alive())
+        except Exception:
+            return False
+
+    def _take_expired(self):
+        # Must be called with the condition held
+        now = time.monotonic()
+        expired = []
+        while self._idle and self._size > self.min_size and now - self._idle[0][1] > self.idle_timeout:
+            expired.append(self._idle.popleft()[0])
+            self._size -= 1
+            self._recycled += 1
+        return expired
+
+    async def acquire(self):
+        """
+        Borrows a connection from the pool, opening a new one if none are idle and the pool is not full.
+
+        :return connection: an open connection, give it back with release()
+        """
+        start = time.monotonic()
+        waited = False
+        async with self._condition:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Connection pool is closed")
+                expired = self._take_expired()
+                if self._idle:
+                    connection, last_used = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    connection, last_used = None, None
+                    self._size += 1
+                    break
+                waited = True
+                remaining = None if self.timeout is None else self.timeout - (time.monotonic() - start)
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError(f"No free connection after {self.timeout}s (max_size={self.max_size})")
+                try:
+                    await asyncio.wait_for(self._condition.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+
+            self._in_use += 1
+            if waited:
+                wait_time = time.monotonic() - start
+                self._waits += 1
+                self._wait_time += wait_time
+                self._max_wait_time = max(self._max_wait_time, wait_time)
+
+        for old in expired:
+            await self._close_quietly(old)
+        try:
+            if connection is not None and time.monotonic() - last_used > self.check_after \
+                    and not await self._alive(connection):
+                await self._close_quietly(connection)
+                self._recycled += 1
+                connection = None
+            if connection is None:
+                connection = await self._new_connection()
+        except BaseException:
+            async with self._condition:
+                self._size -= 1
+                self._in_use -= 1
+                self._condition.notify()
+            raise
+        return connection
+
+    async def release(self, connection, discard=False):
+        """
+        Returns a borrowed connection to the pool.
+
+        :param connection: connection from acquire()
+        :param discard: close the connection instead of reusing it (e.g. it is broken)
+        """
+        async with self._condition:
+            self._in_use -= 1
+            if discard or self._closed:
+                self._size -= 1
+            else:
+                self._idle.append((connection, time.monotonic()))
+                connection = None
+            self._condition.notify()
+        if connection is not None:
+            await self._close_quietly(connection)
+
+    async def close(self):
+        """Closes every idle connection. Borrowed connections are closed when they are released."""
+        async with self._condition:
+            self._closed = True
+            idle = [connection for connection, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            self._condition.notify_all()
+        for connection in idle:
+            await self._close_quietly(connection)
+
+    def stats(self) -> dict:
+        """
+        Snapshot of the pool usage.
+
+        :return stats: dict of in_use, idle, size, created, recycled, waits, total_wait_time, max_wait_time
+        """
+        return {
+            "in_use": self._in_use,
+            "idle": len(self._idle),
+            "size": self._size,
+            "max_size": self.max_size,
+            "created": self._created,
+            "recycled": self._recycled,
+            "waits": self._waits,
+            "total_wait_time": self._wait_time,
+            "max_wait_time": self._max_wait_time,
+        }
+
+
+class AsyncDatabaseConnector:
+    """
+    Same surface as DatabaseConnector but every query is awaited.
+
+    e.g.
+        async with AsyncDatabaseConnector(host="db", database="shop") as db:
+            clients, orders = await asyncio.gather(
+                db.run_sql_dict_output("SELECT * FROM Clients"),
+                db.run_sql("SELECT COUNT(*) FROM Orders"),
+            )
+            async for row in db.iter_sql("SELECT * FROM Orders", as_dict=True):
+                ...
+    """
+
+    def __init__(self, host="0.0.0.0", user="root", password="admin", database="table", database_type="mysql",
+                 pool_min_size=1, pool_max_size=10, pool_timeout=30.0, pool_idle_timeout=300.0):
+        self.host = host
+        self.user = user
+        self.password = password
+        self.database = database
+        self.database_type = database_type
+
+        self.pool_min_size = pool_min_size
+        self.pool_max_size = pool_max_size
+        self.pool_timeout = pool_timeout
+        self.pool_idle_timeout = pool_idle_timeout
+        self._pool = None
+        self._pool_lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        await self._get_pool()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def _connect_mysql(self):
+        import aiomysql
+        connection = await aiomysql.connect(
+            host=self.host,
+            user=self.user,
+            password=self.password,
+            db=self.database
+        )
+        return _AioMySQLConnection(connection)
+
+    async def _connect_postgresql(self):
+        import asyncpg
+        connection = await asyncpg.connect(
+            host=self.host,
+            user=self.user,
+            password=self.password,
+            database=self.database
+        )
+        return _AsyncpgConnection(connection)
+
+    async def _connect_sqlite(self):
+        connection = await asyncio.to_thread(sqlite3.connect, self.database, check_same_thread=False)
+        return _SQLiteConnection(connection)
+
+    async def _connect_database(self):
+        if self.database_type == "mysql":
+            return await self._connect_mysql()
+        if self.database_type == "postgresql":
+            return await self._connect_postgresql()
+        if self.database_type == "sqlite":
+            return await self._connect_sqlite()
+        else:
+            print("NO DATABASE TYPE SELECTED! Assuming mysql")
+            return await self._connect_mysql()
+
+    async def _get_pool(self) -> AsyncConnectionPool:
+        if self._pool is None:
+            async with self._pool_lock:
+                if self._pool is None:
+                    self._pool = await AsyncConnectionPool(
+                        self._connect_database,
+                        min_size=self.pool_min_size,
+                        max_size=self.pool_max_size,
+                        timeout=self.pool_timeout,
+                        idle_timeout=self.pool_idle_timeout
+                    ).open()
+        return self._pool
+
+    @asynccontextmanager
+    async def _borrow(self):
+        """
+        Borrows a pooled connection for the length of the async with block.
+        Commits if the block succeeds, rolls back if it raises and drops the connection if that fails too.
+        """
+        pool = await self._get_pool()
+        connection = await pool.acquire()
+        healthy = True
+        try:
+            await connection.begin()
+            yield connection
+            await connection.commit()
+        except BaseException:
+            try:
+                await connection.rollback()
+            except Exception:
+                healthy = False
+            raise
+        finally:
+            await pool.release(connection, discard=not healthy)
+
+    def pool_stats(self) -> dict:
+        """Connection pool usage, see AsyncConnectionPool.stats(). Empty until the first query."""
+        return self._pool.stats() if self._pool is not None else {}
+
+    async def close(self):
+        """Closes all pooled connections."""
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+    async def run_sql(self, sql: str, params=None) -> list:
+        """
+        Runs an sql statement and gives output of .fetchall.
+
+        e.g.
+            [
+                (1, 'tester'),
+                (2, 'test name')
+            ]
+
+        :param sql: input sql
+        :param params: optional values for the placeholders in sql
+        :return result: output
+        """
+        async with self._borrow() as connection:
+            _, rows = await connection.fetch(sql, params)
+            return rows
+
+    async def run_sql_dict_output(self, sql: str, params=None) -> list:
+        """
+        Runs an sql statement and gives output with column names.
+
+        e.g.
+            [
+                {'ClientId': 1, 'Name': 'tester'},
+                {'ClientId': 2, 'Name': 'test name'}
+            ]
+
+        :param sql: input sql
+        :param params: optional values for the placeholders in sql
+        :return result: output as a dict with column names
+        """
+        async with self._borrow() as connection:
+            column_names, rows = await connection.fetch(sql, params)
+            return [dict(zip(column_names, row)) for row in rows]
+
+    async def iter_sql(self, sql: str, batch_size: int = 1000, as_dict: bool = False, shared_keys: bool = False,
+                       params=None):
+        """
+        Runs an sql statement and yields the rows one at a time from a server side cursor,
+        fetching batch_size rows at a time. Same options as DatabaseConnector.iter_sql.
+
+        e.g.
+            async for row in db.iter_sql("SELECT ClientId, Name FROM Clients", as_dict=True):
+                print(row["Name"])
+
+        :param sql: input sql
+        :param batch_size: number of rows to fetch per round trip
+        :param as_dict: yield {column: value} dicts instead of tuples
+        :param shared_keys: with as_dict, yield Row objects that share one set of column keys
+        :param params: optional values for the placeholders in sql
+        :return result: async generator of rows
+        """
+        async with self._borrow() as connection:
+            index = None
+            batches = connection.iterate(sql, params, batch_size)
+            try:
+                async for column_names, batch in batches:
+                    if not as_dict:
+                        for row in batch:
+                            yield row
+                    elif shared_keys:
+                        if index is None:
+                            index = {name: i for i, name in enumerate(column_names)}
+                        for row in batch:
+                            yield Row(index, row)
+                    else:
+                        for row in batch:
+                            yield dict(zip(column_names, row))
+            finally:
+                await batches.aclose()
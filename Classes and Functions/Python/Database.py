@@ -1,10 +1,362 @@
 """
 Created for MySQL tried to make it easier to add other database types.
 postgresql is not tested.
+sqlite is built in, database is the file path (or ":memory:"), useful for testing without a server.
+
+Connections are pooled, so queries reuse an already open connection instead of
+doing a fresh connect + auth for every call.
+
+Read queries can optionally be served from a QueryCache, pass one in with cache=QueryCache(...).
+
+Connect/execute/fetch/dict building timings are reported to Metrics.metrics when it is enabled.
+Metrics.py is optional, without it next to this file nothing is recorded.
 """
 
+import io
+import itertools
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from collections.abc import Mapping
+from contextlib import closing, contextmanager, nullcontext
+
+try:
+    from Metrics import metrics
+except ImportError:
+    # Running without Metrics.py, the spans and counters do nothing
+    class _NoMetrics:
+        enabled = False
+
+        def count(self, name, value=1, **tags):
+            pass
+
+        def observe(self, name, value, **tags):
+            pass
+
+        def span(self, name, **tags):
+            return nullcontext()
+
+    metrics = _NoMetrics()
+
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe pool of database connections.
+
+    New connections are made with `connect` until max_size are open, after that borrowers
+    wait up to `timeout` seconds for one to be released.
+    Connections idle for longer than idle_timeout are closed (never going below min_size)
+    and ones idle for longer than check_after are health checked with `is_alive` before being handed out.
+    """
+
+    def __init__(self, connect, is_alive=None, min_size=1, max_size=5, timeout=30.0, idle_timeout=300.0,
+                 check_after=30.0):
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ValueError(f"Invalid pool size: min_size={min_size}, max_size={max_size}")
+        self._connect = connect
+        self._is_alive = is_alive
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.check_after = check_after
+
+        self._lock = threading.Condition()
+        self._idle = deque()  # (connection, last_used), oldest on the left
+        self._size = 0
+        self._in_use = 0
+        self._closed = False
+
+        self._created = 0
+        self._recycled = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._max_wait_time = 0.0
+
+        for _ in range(min_size):
+            self._idle.append((self._new_connection(), time.monotonic()))
+            self._size += 1
+
+    def _new_connection(self):
+        connection = self._connect()
+        self._created += 1
+        return connection
+
+    def _alive(self, connection):
+        if self._is_alive is None:
+            return True
+        try:
+            return bool(self._is_alive(connection))
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close_quietly(connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _recycle_idle(self):
+        # Must be called with the lock held
+        now = time.monotonic()
+        while self._idle and self._size > self.min_size and now - self._idle[0][1] > self.idle_timeout:
+            connection, _ = self._idle.popleft()
+            self._size -= 1
+            self._recycled += 1
+            self._close_quietly(connection)
+
+    def acquire(self):
+        """
+        Borrows a connection from the pool, opening a new one if none are idle and the pool is not full.
+
+        :return connection: an open connection, give it back with release()
+        """
+        start = time.monotonic()
+        waited = False
+        with self._lock:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Connection pool is closed")
+                self._recycle_idle()
+                if self._idle:
+                    # LIFO so the most recently used (warmest) connection is reused
+                    connection, last_used = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    connection, last_used = None, None
+                    self._size += 1
+                    break
+                waited = True
+                remaining = None if self.timeout is None else self.timeout - (time.monotonic() - start)
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError(f"No free connection after {self.timeout}s (max_size={self.max_size})")
+                self._lock.wait(remaining)
+
+            self._in_use += 1
+            if waited:
+                wait_time = time.monotonic() - start
+                self._waits += 1
+                self._wait_time += wait_time
+                self._max_wait_time = max(self._max_wait_time, wait_time)
+
+        # Connecting and health checks happen outside the lock so they don't block other borrowers
+        try:
+            if connection is not None and time.monotonic() - last_used > self.check_after \
+                    and not self._alive(connection):
+                self._close_quietly(connection)
+                self._recycled += 1
+                connection = None
+            if connection is None:
+                connection = self._new_connection()
+        except Exception:
+            with self._lock:
+                self._size -= 1
+                self._in_use -= 1
+                self._lock.notify()
+            raise
+        return connection
+
+    def release(self, connection, discard=False):
+        """
+        Returns a borrowed connection to the pool.
+
+        :param connection: connection from acquire()
+        :param discard: close the connection instead of reusing it (e.g. it is broken)
+        """
+        with self._lock:
+            self._in_use -= 1
+            if discard or self._closed:
+                self._size -= 1
+            else:
+                self._idle.append((connection, time.monotonic()))
+                connection = None
+            self._lock.notify()
+        if connection is not None:
+            self._close_quietly(connection)
+
+    def close(self):
+        """Closes every idle connection. Borrowed connections are closed when they are released."""
+        with self._lock:
+            self._closed = True
+            idle = [connection for connection, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            self._lock.notify_all()
+        for connection in idle:
+            self._close_quietly(connection)
+
+    def stats(self) -> dict:
+        """
+        Snapshot of the pool usage.
+
+        :return stats: dict of in_use, idle, size, created, recycled, waits, total_wait_time, max_wait_time
+        """
+        with self._lock:
+            return {
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "size": self._size,
+                "max_size": self.max_size,
+                "created": self._created,
+                "recycled": self._recycled,
+                "waits": self._waits,
+                "total_wait_time": self._wait_time,
+                "max_wait_time": self._max_wait_time,
+            }
+
+
+class Row(Mapping):
+    """
+    Read-only dict-like row used by iter_sql(shared_keys=True).
+
+    Every row from the same query shares one column -> index lookup, so each row only
+    stores its value tuple instead of a full dict.
+    """
+    __slots__ = ("_index", "_values")
+
+    def __init__(self, index: dict, values: tuple):
+        self._index = index
+        self._values = values
+
+    def __getitem__(self, column):
+        return self._values[self._index[column]]
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    def as_tuple(self) -> tuple:
+        return tuple(self._values)
+
+    def __repr__(self):
+        return f"Row({dict(self)})"
+
+
+class QueryCache:
+    """
+    In memory LRU cache of query results with a time to live.
+
+    Entries are dropped once they are older than ttl seconds, and the least recently used entries
+    are evicted when there are more than max_entries or the results add up to more than max_bytes (roughly).
+    Each entry remembers the tables its sql reads from so it can be invalidated by table name.
+    """
+
+    _TABLE_PATTERN = re.compile(r"\b(?:FROM|JOIN|INTO|UPDATE|TABLE)\s+((?:[`\"\[]?\w+[`\"\]]?\.)*[`\"\[]?\w+)",
+                                re.IGNORECASE)
+    _QUOTES = re.compile(r"[`\"\[\]]")
+
+    def __init__(self, ttl=60.0, max_entries=1000, max_bytes=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, size, tables, value), oldest first
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def tables_in(cls, sql: str) -> set:
+        """
+        Table names an sql statement refers to, lower case and without quotes.
+        Schema qualified names are listed both with and without the schema.
+        """
+        tables = set()
+        for match in cls._TABLE_PATTERN.findall(sql):
+            name = cls._QUOTES.sub("", match).lower()
+            tables.add(name)
+            tables.add(name.rsplit(".", 1)[-1])
+        return tables
+
+    @staticmethod
+    def estimate_size(rows) -> int:
+        """Rough size in bytes of a list of row tuples/dicts, good enough for a memory cap."""
+        size = sys.getsizeof(rows)
+        for row in rows:
+            size += sys.getsizeof(row)
+            for value in (row.values() if isinstance(row, dict) else row):
+                size += sys.getsizeof(value)
+        return size
+
+    def get(self, key):
+        """
+        :return (hit, value): value is None on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[3]
+
+    def put(self, key, value, sql: str):
+        size = self.estimate_size(value) if self.max_bytes is not None else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, size, self.tables_in(sql), value)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or \
+                    (self.max_bytes is not None and self._bytes > self.max_bytes):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        # Must be called with the lock held
+        _, size, _, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def invalidate(self, table: str = None) -> int:
+        """
+        Drops cached results.
+
+        :param table: only drop results that read from this table, leave as None to clear everything
+        :return removed: number of entries dropped
+        """
+        with self._lock:
+            if table is None:
+                removed = len(self._entries)
+                self._entries.clear()
+                self._bytes = 0
+                return removed
+            table = self._QUOTES.sub("", table).lower()
+            keys = [key for key, entry in self._entries.items() if table in entry[2]]
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+
 class DatabaseConnector:
-    def __init__(self, host="0.0.0.0", user="root", password="admin", database="table", database_type="mysql"):
+    def __init__(self, host="0.0.0.0", user="root", password="admin", database="table", database_type="mysql",
+                 pool_min_size=1, pool_max_size=5, pool_timeout=30.0, pool_idle_timeout=300.0, cache=None):
         self.host = host
         self.user = user
         self.password = password
@@ -13,6 +365,14 @@ class DatabaseConnector:
         self.connection = None
         self.cursor = None
 
+        self.pool_min_size = pool_min_size
+        self.pool_max_size = pool_max_size
+        self.pool_timeout = pool_timeout
+        self.pool_idle_timeout = pool_idle_timeout
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self.cache = cache
+
     def _connect_mysql(self):
         import mysql.connector
         mydb = mysql.connector.connect(
@@ -21,7 +381,6 @@ class DatabaseConnector:
             password=self.password,
             database=self.database
         )
-        self.connection = mydb
         return mydb
 
     def _connect_postgresql(self):
@@ -32,31 +391,209 @@ class DatabaseConnector:
             password=self.password,
             database=self.database
         )
-        self.connection = mydb
         return mydb
 
+    def _connect_sqlite(self):
+        # Pooled connections are handed between threads, but only ever used by one at a time
+        return sqlite3.connect(self.database, check_same_thread=False)
+
     def _connect_database(self):
+        with metrics.span("database.connect", database_type=self.database_type):
+            return self._connect_by_type()
+
+    def _connect_by_type(self):
         if self.database_type == "mysql":
             return self._connect_mysql()
         if self.database_type == "postgresql":
             return self._connect_postgresql()
+        if self.database_type == "sqlite":
+            return self._connect_sqlite()
         else:
             print("NO DATABASE TYPE SELECTED! Assuming mysql")
             return self._connect_mysql()
 
+    def _ping(self, connection):
+        with closing(connection.cursor()) as cursor:
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+        connection.rollback()
+        return True
+
+    @property
+    def pool(self) -> ConnectionPool:
+        # Created lazily so making a DatabaseConnector doesn't connect straight away
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = ConnectionPool(
+                        self._connect_database,
+                        is_alive=self._ping,
+                        min_size=self.pool_min_size,
+                        max_size=self.pool_max_size,
+                        timeout=self.pool_timeout,
+                        idle_timeout=self.pool_idle_timeout
+                    )
+        return self._pool
+
+    @contextmanager
+    def _borrow(self):
+        """
+        Borrows a pooled connection for the length of the with block.
+        Commits if the block succeeds, rolls back if it raises and drops the connection if that fails too.
+        """
+        connection = self.pool.acquire()
+        healthy = True
+        try:
+            yield connection
+            connection.commit()
+        except BaseException:
+            try:
+                connection.rollback()
+            except Exception:
+                healthy = False
+            raise
+        finally:
+            self.pool.release(connection, discard=not healthy)
+
+    @staticmethod
+    def _is_open(connection):
+        # Opening a cursor fails straight away on a closed sqlite3/mysql.connector/psycopg2 connection,
+        # without a round trip to the server
+        try:
+            connection.cursor().close()
+        except Exception:
+            return False
+        return True
+
     def get_connection(self):
-        self._connect_database()
+        """
+        Borrows a connection from the pool and keeps hold of it until clear_connection() is called.
+        If the held connection was closed by the caller (conn.close() like before pooling) it is
+        dropped from the pool and a fresh one is borrowed instead.
+        """
+        if self.connection is not None and not self._is_open(self.connection):
+            self.pool.release(self.connection, discard=True)
+            self.connection = None
+            self.cursor = None
+        if self.connection is None:
+            self.connection = self.pool.acquire()
         return self.connection
 
     def get_cursor(self):
-        self.cursor = self._connect_database().cursor()
+        self.cursor = self.get_connection().cursor()
         return self.cursor
 
     def clear_connection(self):
+        """
+        Gives the connection from get_connection()/get_cursor() back to the pool.
+        Anything not committed is rolled back first, so the next borrower doesn't commit it by accident.
+        """
+        if self.connection is not None:
+            healthy = True
+            try:
+                if self.cursor is not None:
+                    self.cursor.close()
+            except Exception:
+                pass
+            try:
+                self.connection.rollback()
+            except Exception:
+                healthy = False
+            self.pool.release(self.connection, discard=not healthy)
         self.connection = None
         self.cursor = None
 
-    def run_sql(self, sql: str) -> list:
+    def pool_stats(self) -> dict:
+        """
+        Connection pool usage, see ConnectionPool.stats().
+
+        e.g.
+            {'in_use': 1, 'idle': 4, 'size': 5, 'max_size': 5, 'created': 5, 'recycled': 0,
+             'waits': 2, 'total_wait_time': 0.013, 'max_wait_time': 0.009}
+        """
+        return self.pool.stats()
+
+    def close(self):
+        """Closes all pooled connections."""
+        self.clear_connection()
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+
+    @property
+    def placeholder(self) -> str:
+        """Parameter placeholder used by the driver."""
+        return "?" if self.database_type == "sqlite" else "%s"
+
+    @staticmethod
+    def _execute(cursor, sql: str, params=None):
+        if params is None:
+            cursor.execute(sql)
+        else:
+            cursor.execute(sql, params)
+
+    @staticmethod
+    def _is_read_only(sql: str) -> bool:
+        words = sql.split(None, 1)
+        return bool(words) and words[0].upper() in ("SELECT", "WITH", "SHOW", "DESCRIBE", "EXPLAIN")
+
+    @staticmethod
+    def _freeze(params):
+        if isinstance(params, dict):
+            return tuple(sorted(params.items()))
+        if isinstance(params, list):
+            return tuple(params)
+        return params
+
+    def _cached(self, kind: str, sql: str, params, run):
+        """
+        Returns the cached result of a read query if there is one, otherwise runs it and caches it.
+        Anything that isn't a read invalidates the cached results of the tables it touches.
+        """
+        if self.cache is None:
+            return run()
+        if not self._is_read_only(sql):
+            result = run()
+            self._invalidate_tables(sql)
+            return result
+
+        key = (kind, sql, self._freeze(params))
+        try:
+            hit, result = self.cache.get(key)
+        except TypeError:  # unhashable params
+            return run()
+        if not hit:
+            result = run()
+            self.cache.put(key, result, sql)
+        # Copy so callers changing the result don't change the cache
+        if kind == "dict":
+            return [dict(row) for row in result]
+        return list(result)
+
+    def _invalidate_tables(self, sql: str):
+        if self.cache is not None:
+            for table in QueryCache.tables_in(sql):
+                self.cache.invalidate(table)
+
+    def invalidate_cache(self, table: str = None) -> int:
+        """
+        Drops cached results, e.g. after the table was changed by something other than this connector.
+
+        :param table: only drop results that read from this table, leave as None to clear everything
+        :return removed: number of entries dropped
+        """
+        return self.cache.invalidate(table) if self.cache is not None else 0
+
+    def cache_stats(self) -> dict:
+        """
+        Result cache counters, see QueryCache.stats(). Empty if caching is off.
+
+        e.g.
+            {'entries': 12, 'bytes': 48211, 'hits': 340, 'misses': 12, 'hit_rate': 0.966, 'evictions': 0}
+        """
+        return self.cache.stats() if self.cache is not None else {}
+
+    def run_sql(self, sql: str, params=None) -> list:
         """
             Runs an sql statement and gives output of .fetchall.
 
@@ -66,15 +603,27 @@ class DatabaseConnector:
                     (2, 'test name')
                 ]
 
-            :param sql: input sql
+            db.run_sql("SELECT * FROM Clients WHERE ClientId = %s", (1,))
+
+            :param sql: input sql, with placeholders (%s, or ? for sqlite) if params are given
+            :param params: optional tuple/dict of values passed to the driver, never formatted into the sql
             :return result: output 
         """
-        with self.get_cursor() as cursor:
-            cursor.execute(sql)
-            rows = cursor.fetchall()
-            return rows
+        return self._cached("tuple", sql, params, lambda: self._run_sql(sql, params))
+
+    def _run_sql(self, sql: str, params=None) -> list:
+        with self._borrow() as connection:
+            with closing(connection.cursor()) as cursor:
+                with metrics.span("database.execute", database_type=self.database_type):
+                    self._execute(cursor, sql, params)
+                # Statements like INSERT have no result set to fetch
+                with metrics.span("database.fetch", database_type=self.database_type):
+                    rows = cursor.fetchall() if cursor.description is not None else []
+                metrics.count("database.queries")
+                metrics.count("database.rows", len(rows))
+                return rows
 
-    def run_sql_dict_output(self, sql: str) -> list:
+    def run_sql_dict_output(self, sql: str, params=None) -> list:
         """
         Runs an sql statement and gives output with coloumn names.
 
@@ -84,18 +633,244 @@ class DatabaseConnector:
                 {'ClientId': 2, 'Name': 'test name'}
             ]
 
-        Can take longer to execute as creating the dict can take ages if a large query
+        Can take longer to execute as creating the dict can take ages if a large query,
+        use iter_sql() to stream large results instead.
 
         :param sql: input sql
+        :param params: optional values for the placeholders in sql
         :return result: output as a dict with column names
         """
-        with self._connect_database() as connection:
-            with connection.cursor() as cursor:
-                cursor.execute(sql)
+        return self._cached("dict", sql, params, lambda: self._run_sql_dict_output(sql, params))
+
+    def _run_sql_dict_output(self, sql: str, params=None) -> list:
+        with self._borrow() as connection:
+            with closing(connection.cursor()) as cursor:
+                with metrics.span("database.execute", database_type=self.database_type):
+                    self._execute(cursor, sql, params)
                 # Fetch all rows from the executed query
-                rows = cursor.fetchall()
+                with metrics.span("database.fetch", database_type=self.database_type):
+                    rows = cursor.fetchall()
                 # Get column names from the cursor description
                 column_names = [desc[0] for desc in cursor.description]
                 # Create a list of dictionaries
-                result = [dict(zip(column_names, row)) for row in rows]
+                with metrics.span("database.dict", database_type=self.database_type):
+                    result = [dict(zip(column_names, row)) for row in rows]
+                metrics.count("database.queries")
+                metrics.count("database.rows", len(rows))
                 return result
+
+    def _streaming_cursor(self, connection, batch_size: int):
+        """
+        Cursor that leaves the result set on the server and pulls it down as it is read.
+        mysql.connector cursors are unbuffered by default, psycopg2 needs a named cursor.
+        """
+        if self.database_type == "postgresql":
+            cursor = connection.cursor(name=f"iter_sql_{id(connection)}_{time.monotonic_ns()}")
+            cursor.itersize = batch_size
+            return cursor
+        if self.database_type == "mysql":
+            return connection.cursor(buffered=False)
+        return connection.cursor()
+
+    def iter_sql(self, sql: str, batch_size: int = 1000, as_dict: bool = False, shared_keys: bool = False,
+                 server_side: bool = True, params=None):
+        """
+        Runs an sql statement and yields the rows one at a time, fetching batch_size rows from
+        the database at a time so memory use stays flat however big the result is.
+
+        The pooled connection is held until the generator is exhausted or closed.
+
+        e.g.
+            for row in db.iter_sql("SELECT ClientId, Name FROM Clients", as_dict=True):
+                print(row["Name"])
+
+        :param sql: input sql
+        :param batch_size: number of rows to fetch per round trip
+        :param as_dict: yield {column: value} dicts instead of tuples
+        :param shared_keys: with as_dict, yield Row objects that share one set of column keys instead of a new dict per row
+        :param server_side: use a server side / unbuffered cursor so the whole result is never held client side
+        :param params: optional values for the placeholders in sql
+        :return result: generator of rows
+        """
+        with self._borrow() as connection:
+            cursor = self._streaming_cursor(connection, batch_size) if server_side else connection.cursor()
+            with closing(cursor):
+                with metrics.span("database.execute", database_type=self.database_type):
+                    self._execute(cursor, sql, params)
+                metrics.count("database.queries")
+                rows = self._iter_batches(cursor, batch_size)
+                if not as_dict:
+                    yield from rows
+                    return
+
+                # psycopg2 named cursors only fill in description once the first batch is fetched
+                first = next(rows, None)
+                if first is None:
+                    return
+                column_names = tuple(desc[0] for desc in cursor.description)
+                rows = itertools.chain((first,), rows)
+                if shared_keys:
+                    index = {name: i for i, name in enumerate(column_names)}
+                    for row in rows:
+                        yield Row(index, row)
+                else:
+                    for row in rows:
+                        yield dict(zip(column_names, row))
+
+    @staticmethod
+    def _iter_batches(cursor, batch_size: int):
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if not batch:
+                return
+            yield from batch
+
+    def run_sql_columns(self, sql: str, params=None, batch_size: int = 10000, as_numpy: bool = False,
+                        dtypes: dict = None) -> dict:
+        """
+        Runs an sql statement and gives the output column by column, built straight from
+        fetched batches without making a dict per row.
+
+        e.g.
+            {
+                'ClientId': [1, 2],
+                'Name': ['tester', 'test name']
+            }
+
+        :param sql: input sql
+        :param params: optional values for the placeholders in sql
+        :param batch_size: number of rows to fetch per round trip
+        :param as_numpy: give NumPy arrays instead of lists (`pip install numpy`)
+        :param dtypes: optional {column: dtype} hints for the NumPy arrays, e.g. {'ClientId': 'int64'}
+        :return result: dict of column name -> list/array of values
+        """
+        columns = {}
+        with self._borrow() as connection:
+            with closing(self._streaming_cursor(connection, batch_size)) as cursor:
+                self._execute(cursor, sql, params)
+                values = None
+                while True:
+                    batch = cursor.fetchmany(batch_size)
+                    if values is None and cursor.description is not None:
+                        columns = {desc[0]: [] for desc in cursor.description}
+                        values = list(columns.values())
+                    if not batch:
+                        break
+                    for column_values, batch_values in zip(values, zip(*batch)):
+                        column_values.extend(batch_values)
+
+        if as_numpy:
+            import numpy as np
+            dtypes = dtypes or {}
+            columns = {name: np.asarray(column_values, dtype=dtypes.get(name))
+                       for name, column_values in columns.items()}
+        return columns
+
+    def run_sql_dataframe(self, sql: str, params=None, batch_size: int = 10000, dtypes: dict = None):
+        """
+        Runs an sql statement and gives the output as a pandas DataFrame (`pip install pandas`),
+        built from the column lists of run_sql_columns() rather than from row dicts.
+        Can go straight into ExcelCreator.set_entire_data().
+
+        :param sql: input sql
+        :param params: optional values for the placeholders in sql
+        :param batch_size: number of rows to fetch per round trip
+        :param dtypes: optional {column: dtype} to convert columns to, e.g. {'Created': 'datetime64[ns]'}
+        :return result: DataFrame with one column per selected column
+        """
+        import pandas as pd
+        data_frame = pd.DataFrame(self.run_sql_columns(sql, params, batch_size=batch_size), copy=False)
+        if dtypes:
+            data_frame = data_frame.astype(dtypes)
+        return data_frame
+
+    @staticmethod
+    def _chunks(iterable, chunk_size: int):
+        iterator = iter(iterable)
+        while True:
+            chunk = list(itertools.islice(iterator, chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+    def execute_many(self, sql: str, seq_of_params, chunk_size: int = 1000) -> int:
+        """
+        Runs the same statement for every set of params, sending them chunk_size at a time
+        instead of one round trip per row. Everything runs in one transaction.
+
+        PostgreSQL can't report the rows affected here (execute_batch runs each chunk as one multi
+        statement execute and psycopg2 only keeps the last statement's rowcount), so for it the count
+        returned is the number of param sets sent, not the rows the statements actually changed.
+
+        e.g.
+            db.execute_many("INSERT INTO Clients (ClientId, Name) VALUES (%s, %s)", [(1, 'tester'), (2, 'test name')])
+
+        :param sql: input sql with placeholders
+        :param seq_of_params: iterable of param tuples/dicts, can be a generator
+        :param chunk_size: number of param sets sent per batch
+        :return rowcount: total number of rows affected (param sets sent on PostgreSQL)
+        """
+        total = 0
+        with self._borrow() as connection:
+            with closing(connection.cursor()) as cursor:
+                for chunk in self._chunks(seq_of_params, chunk_size):
+                    if self.database_type == "postgresql":
+                        # psycopg2's executemany is a loop of single executes, execute_batch packs them
+                        from psycopg2.extras import execute_batch
+                        execute_batch(cursor, sql, chunk, page_size=chunk_size)
+                        # rowcount would only be the chunk's last statement, count what was sent instead
+                        total += len(chunk)
+                    else:
+                        # mysql.connector rewrites INSERTs into a single multi row statement itself
+                        cursor.executemany(sql, chunk)
+                        total += max(cursor.rowcount, 0)
+        self._invalidate_tables(sql)
+        return total
+
+    def bulk_insert(self, table: str, columns: list, rows, chunk_size: int = 1000) -> int:
+        """
+        Loads rows into a table as fast as the database allows.
+        MySQL gets one multi row INSERT ... VALUES (...), (...) per chunk,
+        PostgreSQL streams each chunk through COPY ... FROM STDIN.
+
+        table and columns are put into the sql as given, so they must not come from user input.
+
+        e.g.
+            db.bulk_insert("Clients", ["ClientId", "Name"], [(1, 'tester'), (2, 'test name')])
+
+        :param table: table name
+        :param columns: list of column names, in the same order as the values in each row
+        :param rows: iterable of row tuples, can be a generator
+        :param chunk_size: number of rows per statement / COPY
+        :return rowcount: number of rows inserted
+        """
+        column_list = ", ".join(columns)
+        total = 0
+        with self._borrow() as connection:
+            with closing(connection.cursor()) as cursor:
+                for chunk in self._chunks(rows, chunk_size):
+                    if self.database_type == "postgresql":
+                        cursor.copy_expert(f"COPY {table} ({column_list}) FROM STDIN WITH (FORMAT csv)",
+                                           self._copy_buffer(chunk))
+                    else:
+                        row_placeholder = "(" + ", ".join([self.placeholder] * len(columns)) + ")"
+                        sql = f"INSERT INTO {table} ({column_list}) VALUES " + ", ".join([row_placeholder] * len(chunk))
+                        cursor.execute(sql, [value for row in chunk for value in row])
+                    total += len(chunk)
+        self.invalidate_cache(table)
+        return total
+
+    @staticmethod
+    def _copy_buffer(chunk) -> io.StringIO:
+        """
+        CSV text for COPY. Every value is quoted so only None ends up as an unquoted empty field, which COPY reads as NULL.
+        """
+        buffer = io.StringIO()
+        for row in chunk:
+            buffer.write(",".join(
+                "" if value is None else '"' + str(value).replace('"', '""') + '"'
+                for value in row
+            ))
+            buffer.write("\n")
+        buffer.seek(0)
+        return buffer
@@ -3,11 +3,146 @@ Uses pandas to convert a dataframe into an Excel sheet.
 
 Add the data
 then create_excel()
+
+More sheets can be added with add_sheet(), they are prepared in parallel and
+written into the same workbook by create_excel().
+
+For exports too big to hold in memory use create_excel_streaming(rows) instead,
+which writes rows to disk as they come in.
+
+xlsx is slow to write, create(format="csv" / "csv.gz" / "parquet") writes the same data
+in a faster format. Parquet needs `pip install pyarrow`.
+
+create_excel() reports its DataFrame build/write/table styling timings to Metrics.metrics when it is enabled
+(Metrics.py is optional, leave it out and nothing is recorded).
 """
 
 
 import pandas as pd
+import datetime
+import gzip
+import itertools
 import os
+import time
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+try:
+    from Metrics import metrics
+except ImportError:
+    # No Metrics.py next to this file, record nothing
+    class _NoMetrics:
+        enabled = False
+
+        def count(self, name, value=1, **tags):
+            pass
+
+        def observe(self, name, value, **tags):
+            pass
+
+        def span(self, name, **tags):
+            return nullcontext()
+
+    metrics = _NoMetrics()
+
+# Rows per worksheet allowed by Excel, including the header row
+EXCEL_MAX_ROWS = 1_048_576
+
+
+def _write_csv(path, chunks):
+    with open(path, "w", newline="", encoding="utf-8") as file:
+        for i, chunk in enumerate(chunks):
+            chunk.to_csv(file, header=i == 0, index=False)
+
+
+def _write_csv_gz(path, chunks):
+    # Level 6 is much faster than gzip's default of 9 for about the same size
+    with gzip.open(path, "wt", newline="", encoding="utf-8", compresslevel=6) as file:
+        for i, chunk in enumerate(chunks):
+            chunk.to_csv(file, header=i == 0, index=False)
+
+
+def _promote_schema(schema, new_schema):
+    """
+    Schema wide enough for both, columns that were all None take the new type, ints and floats
+    become float64 and anything else that clashes is stored as text.
+    """
+    import pyarrow as pa
+
+    def numeric(data_type):
+        return pa.types.is_integer(data_type) or pa.types.is_floating(data_type)
+
+    fields = []
+    for field, new_field in zip(schema, new_schema):
+        if field.type == new_field.type or pa.types.is_null(new_field.type):
+            fields.append(field)
+        elif pa.types.is_null(field.type):
+            fields.append(field.with_type(new_field.type))
+        elif numeric(field.type) and numeric(new_field.type):
+            fields.append(field.with_type(pa.float64()))
+        else:
+            fields.append(field.with_type(pa.string()))
+    return pa.schema(fields, metadata=schema.metadata)
+
+
+def _write_parquet(path, chunks):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # Written under a temporary name and renamed once complete, so a failed export leaves no partial file.
+    # The schema comes from the first chunk, if a later one doesn't fit (e.g. 2.7 in a column of ints)
+    # what is written so far is copied into a new file with a wider schema, a row group at a time
+    temp_paths = [f"{path}.part"]
+    writer = None
+
+    def rewrite(schema):
+        nonlocal writer
+        writer.close()
+        writer = None
+        temp_paths.append(f"{path}.part{len(temp_paths)}")
+        writer = pq.ParquetWriter(temp_paths[-1], schema)
+        written = pq.ParquetFile(temp_paths[-2])
+        for i in range(written.num_row_groups):
+            writer.write_table(written.read_row_group(i).cast(schema))
+        written.close()
+        os.remove(temp_paths[-2])
+
+    try:
+        for chunk in chunks:
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(temp_paths[-1], table.schema)
+            if table.schema != writer.schema:
+                try:
+                    table = table.cast(writer.schema)
+                except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+                    rewrite(_promote_schema(writer.schema, table.schema))
+                    table = table.cast(writer.schema)
+            writer.write_table(table)
+        if writer is not None:
+            if any(pa.types.is_null(field.type) for field in writer.schema):
+                # Columns that never had a value are stored as text rather than parquet's null type
+                rewrite(pa.schema([field.with_type(pa.string()) if pa.types.is_null(field.type) else field
+                                   for field in writer.schema], metadata=writer.schema.metadata))
+            writer.close()
+            writer = None
+            os.replace(temp_paths[-1], path)
+    finally:
+        if writer is not None:
+            writer.close()
+        for temp_path in temp_paths:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+
+# format -> (file extension, function(path, iterator of DataFrame chunks)).
+# Add to this to support more formats in ExcelCreator.create().
+OUTPUT_ENGINES = {
+    "csv": (".csv", _write_csv),
+    "csv.gz": (".csv.gz", _write_csv_gz),
+    "parquet": (".parquet", _write_parquet),
+}
 
 
 class ExcelCreator:
@@ -18,8 +153,11 @@ class ExcelCreator:
         :param file_name: The name of the Excel file to create (without extension).
         :param sheet_name: The name of the sheet in the Excel file.
         """
+        self._pending_rows = []
         self.data_frame = pd.DataFrame()
         self.sheet_name = sheet_name
+        self.extra_sheets = {}
+        self.sheet_timings = {}
         self.dir = folder
 
         if not os.path.exists(self.dir):
@@ -28,6 +166,39 @@ class ExcelCreator:
 
         self.file_name = self.dir + "/" + file_name
 
+    @property
+    def data_frame(self):
+        """
+        The data as a DataFrame. Rows from add_row()/add_rows() are kept in a plain list
+        and only added to the DataFrame the first time it is needed.
+        """
+        if self._pending_rows:
+            self._flush_rows()
+        return self._data_frame
+
+    @data_frame.setter
+    def data_frame(self, data_frame):
+        self._pending_rows = []
+        self._data_frame = data_frame
+
+    def _flush_rows(self):
+        rows, self._pending_rows = self._pending_rows, []
+        with metrics.span("excel.flush", sheet=self.sheet_name):
+            new_rows = pd.DataFrame(rows, columns=self._data_frame.columns)
+            if len(self._data_frame) == 0:
+                self._data_frame = new_rows
+            else:
+                self._data_frame = pd.concat([self._data_frame, new_rows], ignore_index=True)
+
+    def _check_row(self, data):
+        columns = self._data_frame.columns
+        if isinstance(data, Mapping):
+            return tuple(data[column] for column in columns)
+        if len(data) != len(columns):
+            raise ValueError(
+                f"Row length ({len(data)}) does not match the number of columns in the DataFrame ({len(columns)}).")
+        return tuple(data)
+
     def set_entire_data(self, data, columns=None):
         """
         Sets the data for the Excel file.
@@ -56,12 +227,16 @@ class ExcelCreator:
 
         :param data: The row data to add. Length must match the number of columns.
         """
-        if len(data) != len(self.data_frame.columns):
-            raise ValueError(
-                f"Row length ({len(data)}) does not match the number of columns in the DataFrame ({len(self.data_frame.columns)}).")
+        # Buffered rather than appended with .loc, which copies the whole DataFrame every time
+        self._pending_rows.append(self._check_row(data))
 
-        # Append the new row to the DataFrame
-        self.data_frame.loc[len(self.data_frame)] = data
+    def add_rows(self, rows):
+        """
+        Adds many rows to the DataFrame.
+
+        :param rows: Iterable of rows (e.g. straight from DatabaseConnector.iter_sql), each the same length as the columns.
+        """
+        self._pending_rows.extend(self._check_row(row) for row in rows)
 
     def reorder_columns(self, new_order):
         """
@@ -87,39 +262,236 @@ class ExcelCreator:
             n = n // 26 - 1
         return name
 
-    def create_excel(self, apply_style=True):
+    def add_sheet(self, sheet_name, data, columns=None):
+        """
+        Adds another sheet to the workbook, next to the main sheet_name / data_frame one.
+
+        :param sheet_name: The name of the sheet, must be unique.
+        :param data: A DataFrame, anything pd.DataFrame accepts (dict, list of dicts, ...) or a function taking
+                     no arguments that returns one of those, e.g. lambda: db.run_sql_dataframe(sql).
+                     Functions are only called in create_excel(), in parallel with the other sheets.
+        :param columns: Optional list of column names.
+        """
+        if sheet_name == self.sheet_name or sheet_name in self.extra_sheets:
+            raise ValueError(f"Sheet '{sheet_name}' already exists.")
+        self.extra_sheets[sheet_name] = (data, columns)
+
+    def _prepare_sheet(self, sheet_name, data, columns, apply_style):
+        """Builds the DataFrame and table settings for one sheet. Runs on a worker thread."""
+        start = time.perf_counter()
+        if callable(data):
+            data = data()
+        if not isinstance(data, pd.DataFrame) or columns is not None:
+            data = pd.DataFrame(data, columns=columns)
+        table = self._table_settings(data.columns, len(data)) if apply_style and not data.empty else None
+        prepare_time = time.perf_counter() - start
+        metrics.observe("excel.build", prepare_time, sheet=sheet_name)
+        return sheet_name, data, table, prepare_time
+
+    def create_excel(self, apply_style=True, max_workers=None):
         """
         Creates an Excel file with the current DataFrame data, with optional table styling.
+        Sheets from add_sheet() are prepared on a thread pool then written one after another into
+        the same workbook. How long each sheet took is printed and kept in self.sheet_timings.
 
         :param apply_style: If True, formats the data as an Excel table. Defaults to True.
+        :param max_workers: Threads used to prepare sheets. Defaults to ThreadPoolExecutor's default.
         """
-        if self.data_frame.empty:
+        if self.data_frame.empty and not self.extra_sheets:
             raise ValueError("The DataFrame is empty. Please set the data before creating the Excel file.")
 
+        sheets = [(name, data, columns) for name, (data, columns) in self.extra_sheets.items()]
+        if not self.data_frame.empty:
+            sheets.insert(0, (self.sheet_name, self.data_frame, None))
+
+        if len(sheets) == 1:
+            prepared = [self._prepare_sheet(*sheets[0], apply_style)]
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                prepared = list(executor.map(lambda sheet: self._prepare_sheet(*sheet, apply_style), sheets))
+
+        self.sheet_timings = {}
         # Use a context manager to ensure the writer is properly closed
-        with pd.ExcelWriter(f"{self.file_name}.xlsx", engine="xlsxwriter") as writer:
-            # Write the DataFrame to the Excel file
-            self.data_frame.to_excel(writer, sheet_name=self.sheet_name, index=False)
+        with metrics.span("excel.save"), pd.ExcelWriter(f"{self.file_name}.xlsx", engine="xlsxwriter") as writer:
+            for sheet_name, data_frame, table, prepare_time in prepared:
+                start = time.perf_counter()
+                # Write the DataFrame to the Excel file
+                with metrics.span("excel.write", sheet=sheet_name):
+                    data_frame.to_excel(writer, sheet_name=sheet_name, index=False)
+
+                # Access the worksheet object
+                worksheet = writer.sheets[sheet_name]
+
+                if table is not None:
+                    with metrics.span("excel.style", sheet=sheet_name):
+                        self._style_sheet(worksheet, table)
+
+                self.sheet_timings[sheet_name] = {"rows": len(data_frame), "prepare": prepare_time,
+                                                  "write": time.perf_counter() - start}
+
+        if len(prepared) > 1:
+            for sheet_name, timing in self.sheet_timings.items():
+                print(f"  {sheet_name}: {timing['rows']} rows, prepared in {timing['prepare']:.3f}s, "
+                      f"written in {timing['write']:.3f}s")
+        print(f"Excel file '{self.file_name}.xlsx' created successfully.")
+
+    def _table_settings(self, columns, max_row):
+        """Range and options for an Excel table over the header + max_row data rows."""
+        # Define the range for the table
+        table_range = f"A1:{self.excel_column_name(len(columns) - 1)}{max_row + 1}"
+
+        # Create a list of column headers for the table
+        column_settings = [{"header": str(column)} for column in columns]
+        return table_range, {"columns": column_settings, "autofilter": True}
+
+    def _style_sheet(self, worksheet, table):
+        """Formats the written data as an Excel table and widens the columns."""
+        table_range, options = table
+
+        # Add the Excel table structure. The data has already been written.
+        worksheet.add_table(table_range, options)
+
+        # Set the column widths for better readability
+        worksheet.set_column(0, len(options["columns"]) - 1, 15)
+
+    def create_excel_streaming(self, rows, columns=None, apply_style=True):
+        """
+        Writes rows straight to disk as they are read from `rows`, using xlsxwriter's constant_memory mode,
+        so only one row is held in memory at a time. Doesn't use (or need) the DataFrame.
+        When a sheet reaches Excel's 1,048,576 row limit the rest spills onto sheet_name_2, sheet_name_3, ...
 
-            # Access the workbook and worksheet objects
-            workbook = writer.book
-            worksheet = writer.sheets[self.sheet_name]
+        xlsxwriter can't add Excel tables in constant_memory mode, so apply_style gives each sheet a
+        table-style header row with an autofilter and the same column widths as create_excel().
 
+        e.g.
+            excel.create_excel_streaming(db.iter_sql("SELECT * FROM Orders"), columns=["OrderId", "Total"])
+
+        :param rows: Iterable of rows (tuples/lists, or dicts keyed by column name), can be a generator.
+        :param columns: Column names. Defaults to the columns of the current DataFrame.
+        :param apply_style: If True, formats the data on each sheet as an Excel table. Defaults to True.
+        :return row_count: Number of data rows written.
+        """
+        import xlsxwriter
+
+        columns = list(self.data_frame.columns if columns is None else columns)
+        if not columns:
+            raise ValueError("No columns given. Please pass columns or set the data before creating the Excel file.")
+
+        workbook = xlsxwriter.Workbook(f"{self.file_name}.xlsx", {"constant_memory": True})
+        date_format = workbook.add_format({"num_format": "yyyy-mm-dd hh:mm:ss"})
+        header_format = workbook.add_format({"bold": True, "font_color": "#FFFFFF", "bg_color": "#4F81BD"})
+
+        def write_date(worksheet, row, col, value, cell_format=None):
+            return worksheet.write_datetime(row, col, value, cell_format or date_format)
+
+        sheets = []
+
+        def new_sheet():
+            name = self.sheet_name if not sheets else f"{self.sheet_name[:27]}_{len(sheets) + 1}"
+            worksheet = workbook.add_worksheet(name)
+            for date_type in (datetime.datetime, datetime.date):
+                worksheet.add_write_handler(date_type, write_date)
+            worksheet.write_row(0, 0, columns, header_format if apply_style else None)
             if apply_style:
-                # Get the dimensions of the DataFrame
-                (max_row, max_col) = self.data_frame.shape
+                worksheet.set_column(0, len(columns) - 1, 15)
+            sheets.append(worksheet)
+            return worksheet
 
-                # Define the range for the table
-                table_range = f"A1:{self.excel_column_name(max_col - 1)}{max_row + 1}"
-                # table_range = f"A1:{chr(64 + max_col)}{max_row + 1}"  # Assuming max_col <= 26
+        total = 0
+        sheet_rows = 0
+        worksheet = new_sheet()
+        try:
+            for row in rows:
+                if sheet_rows == EXCEL_MAX_ROWS - 1:
+                    if apply_style:
+                        worksheet.autofilter(0, 0, sheet_rows, len(columns) - 1)
+                    worksheet = new_sheet()
+                    sheet_rows = 0
+                if isinstance(row, Mapping):
+                    row = [row[column] for column in columns]
+                sheet_rows += 1
+                worksheet.write_row(sheet_rows, 0, row)
+            total = (len(sheets) - 1) * (EXCEL_MAX_ROWS - 1) + sheet_rows
 
-                # Create a list of column headers for the table
-                column_settings = [{"header": column} for column in self.data_frame.columns]
+            if apply_style:
+                worksheet.autofilter(0, 0, sheet_rows, len(columns) - 1)
+        finally:
+            workbook.close()
 
-                # Add the Excel table structure. Pandas has already written the data.
-                worksheet.add_table(table_range, {"columns": column_settings, "autofilter": True})
+        print(f"Excel file '{self.file_name}.xlsx' created successfully ({total} rows, {len(sheets)} sheet(s)).")
+        return total
 
-                # Set the column widths for better readability
-                worksheet.set_column(0, max_col - 1, 15)
+    @staticmethod
+    def _frame_chunks(data_frame, chunk_size):
+        for start in range(0, max(len(data_frame), 1), chunk_size):
+            yield data_frame.iloc[start:start + chunk_size]
 
-        print(f"Excel file '{self.file_name}.xlsx' created successfully.")
+    @staticmethod
+    def _row_chunks(rows, columns, chunk_size):
+        rows = iter(rows)
+        empty = True
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                if empty:
+                    # Still give the engines one chunk, so the file gets its header/schema
+                    yield pd.DataFrame(columns=columns)
+                return
+            empty = False
+            if isinstance(chunk[0], Mapping):
+                chunk = [[row[column] for column in columns] for row in chunk]
+            yield pd.DataFrame(chunk, columns=columns)
+
+    def create(self, format="xlsx", rows=None, columns=None, apply_style=True, chunk_size=100_000):
+        """
+        Writes the data in the chosen format using the same data as create_excel().
+        xlsx goes through create_excel() (or create_excel_streaming() if rows are given),
+        the other formats in OUTPUT_ENGINES are written chunk_size rows at a time.
+        Sheets from add_sheet() are written to their own files, file_name_<sheet name>.<extension>.
+
+        e.g.
+            excel.create("csv.gz")
+            excel.create("parquet", rows=db.iter_sql("SELECT * FROM Orders"), columns=["OrderId", "Total"])
+
+        :param format: "xlsx" or a key of OUTPUT_ENGINES ("csv", "csv.gz", "parquet").
+        :param rows: Optional iterable of rows to stream to disk instead of the DataFrame.
+        :param columns: Column names for rows. Defaults to the columns of the current DataFrame.
+        :param apply_style: Only used for xlsx.
+        :param chunk_size: Number of rows converted and written at a time.
+        :return paths: List of the files written.
+        """
+        if format == "xlsx":
+            if rows is not None:
+                self.create_excel_streaming(rows, columns, apply_style)
+                return [f"{self.file_name}.xlsx"]
+            self.create_excel(apply_style)
+            return [f"{self.file_name}.xlsx"]
+
+        if format not in OUTPUT_ENGINES:
+            raise ValueError(f"Unknown format '{format}', expected one of: xlsx, {', '.join(OUTPUT_ENGINES)}")
+        extension, engine = OUTPUT_ENGINES[format]
+
+        if rows is not None:
+            columns = list(self.data_frame.columns if columns is None else columns)
+            if not columns:
+                raise ValueError("No columns given. Please pass columns or set the data before creating the file.")
+            path = f"{self.file_name}{extension}"
+            engine(path, self._row_chunks(rows, columns, chunk_size))
+            print(f"File '{path}' created successfully.")
+            return [path]
+
+        if self.data_frame.empty and not self.extra_sheets:
+            raise ValueError("The DataFrame is empty. Please set the data before creating the file.")
+
+        paths = []
+        sheets = [(f"{self.file_name}_{name}", data, sheet_columns)
+                  for name, (data, sheet_columns) in self.extra_sheets.items()]
+        if not self.data_frame.empty:
+            sheets.insert(0, (self.file_name, self.data_frame, None))
+        for file_name, data, sheet_columns in sheets:
+            _, data_frame, _, _ = self._prepare_sheet(file_name, data, sheet_columns, apply_style=False)
+            path = f"{file_name}{extension}"
+            engine(path, self._frame_chunks(data_frame, chunk_size))
+            paths.append(path)
+            print(f"File '{path}' created successfully.")
+        return paths
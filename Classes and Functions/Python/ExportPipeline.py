@@ -0,0 +1,266 @@
+"""
+Database -> encrypt columns -> convert epoch columns -> xlsx/csv/parquet as one streaming job.
+
+The three stages run at the same time, fetch and transform on their own threads and the writer on the
+calling thread, handing batches over through small bounded queues. A stage that gets ahead blocks
+until the next one catches up, so at most about (2 * queue_size + 3) batches are held at once,
+however many rows the query returns.
+
+db = DatabaseConnector(...)
+pipeline = ExportPipeline(db, "SELECT ClientId, Email, CreatedAt FROM Clients", "exports", "clients",
+                          cipher=AESCipher(password, salt), encrypt_columns=["Email"], epoch_columns=["CreatedAt"])
+stats = pipeline.run()
+print(stats["rows_per_second"], stats["stages"]["fetch"]["wait_seconds"])
+
+Nothing is written if the query gives no rows (there are no column names to write either).
+"""
+
+import itertools
+import math
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import closing
+
+from ExcelCreator import ExcelCreator
+from Metrics import metrics
+from util_functions import convert_epochs
+
+_DONE = object()
+
+
+class _Stopped(Exception):
+    """Another stage failed, so this one gives up."""
+
+
+class StageStats:
+    __slots__ = ("rows", "batches", "busy", "waiting")
+
+    def __init__(self):
+        self.rows = 0
+        self.batches = 0
+        self.busy = 0.0
+        self.waiting = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "rows": self.rows,
+            "batches": self.batches,
+            "busy_seconds": self.busy,
+            "wait_seconds": self.waiting,
+            "rows_per_second": self.rows / self.busy if self.busy else 0.0,
+        }
+
+
+class ExportPipeline:
+    def __init__(self, database, sql, folder, file_name, params=None, format="xlsx", cipher=None,
+                 encrypt_columns=(), epoch_columns=(), epoch_format='%Y-%m-%d %H:%M:%S', epoch_tz=None,
+                 batch_size=5000, queue_size=4, encrypt_workers=None, sheet_name="Sheet1", apply_style=True):
+        """
+        :param database: DatabaseConnector to read from, rows are streamed with iter_sql().
+        :param sql: The query to export, with placeholders if params are given.
+        :param folder: Folder to write the file to.
+        :param file_name: File name without the extension.
+        :param params: Optional values for the placeholders in sql.
+        :param format: "xlsx" or a key of ExcelCreator's OUTPUT_ENGINES ("csv", "csv.gz", "parquet").
+        :param cipher: AESCipher used for encrypt_columns.
+        :param encrypt_columns: Columns replaced by their encrypt() output (as text), None values are left as they are.
+        :param epoch_columns: Columns of millisecond epochs converted to date strings with convert_epochs().
+        :param epoch_format: strftime format for epoch_columns.
+        :param epoch_tz: Timezone for epoch_columns, None for local time like convert_epoch.
+        :param batch_size: Rows per batch passed between stages, also the database fetch size.
+        :param queue_size: Batches each queue holds before the stage feeding it has to wait.
+        :param encrypt_workers: Processes to encrypt with, one pool is kept for the whole run and each
+                                batch is split evenly between them. None encrypts on the transform thread.
+        :param sheet_name: Sheet name for xlsx.
+        :param apply_style: Header styling for xlsx.
+        """
+        if encrypt_columns and cipher is None:
+            raise ValueError("encrypt_columns needs a cipher")
+        self.database = database
+        self.sql = sql
+        self.params = params
+        self.format = format
+        self.cipher = cipher
+        self.encrypt_columns = list(encrypt_columns)
+        self.epoch_columns = list(epoch_columns)
+        self.epoch_format = epoch_format
+        self.epoch_tz = epoch_tz
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.encrypt_workers = encrypt_workers
+        self.creator = ExcelCreator(folder, file_name, sheet_name)
+        self.apply_style = apply_style
+        self.columns = None
+        self._executor = None
+
+    def _get(self, source, stats):
+        start = time.perf_counter()
+        while True:
+            try:
+                item = source.get(timeout=0.1)
+                break
+            except queue.Empty:
+                if self._stop.is_set():
+                    raise _Stopped()
+        stats.waiting += time.perf_counter() - start
+        return item
+
+    def _put(self, target, item, stats):
+        start = time.perf_counter()
+        while True:
+            try:
+                target.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                if self._stop.is_set():
+                    raise _Stopped()
+        stats.waiting += time.perf_counter() - start
+
+    def _stage(self, name, work):
+        """Runs a stage on its own thread, a failure stops the other stages and is raised by run()."""
+        stats = self.stats[name]
+        start = time.perf_counter()
+        try:
+            work(stats)
+        except _Stopped:
+            pass
+        except BaseException as e:
+            self._errors.append(e)
+            self._stop.set()
+        finally:
+            stats.busy = time.perf_counter() - start - stats.waiting
+
+    def _fetch(self, stats):
+        rows = self.database.iter_sql(self.sql, batch_size=self.batch_size, as_dict=True, shared_keys=True,
+                                      params=self.params)
+        with closing(rows):
+            while True:
+                batch = list(itertools.islice(rows, self.batch_size))
+                if not batch:
+                    break
+                if self.columns is None:
+                    self._set_columns(list(batch[0]))
+                batch = [row.as_tuple() for row in batch]
+                stats.rows += len(batch)
+                stats.batches += 1
+                self._put(self.fetched, batch, stats)
+        self._put(self.fetched, _DONE, stats)
+
+    def _set_columns(self, columns):
+        missing = [column for column in self.encrypt_columns + self.epoch_columns if column not in columns]
+        if missing:
+            raise ValueError(f"Columns {missing} are not in the query's columns {columns}")
+        self.columns = columns
+
+    def _transform(self, stats):
+        while True:
+            batch = self._get(self.fetched, stats)
+            if batch is _DONE:
+                break
+            batch = self.transform_batch(batch)
+            stats.rows += len(batch)
+            stats.batches += 1
+            self._put(self.transformed, batch, stats)
+        self._put(self.transformed, _DONE, stats)
+
+    @staticmethod
+    def _to_bytes(value):
+        return value if isinstance(value, bytes) else str(value).encode("utf-8")
+
+    def transform_batch(self, rows) -> list:
+        """Encrypts and converts one batch of row tuples, a column at a time so the bulk functions can be used."""
+        if not self.encrypt_columns and not self.epoch_columns:
+            return rows
+        index = {column: i for i, column in enumerate(self.columns)}
+        columns = [list(values) for values in zip(*rows)]
+        for column in self.encrypt_columns:
+            values = columns[index[column]]
+            present = [i for i, value in enumerate(values) if value is not None]
+            plaintexts = [self._to_bytes(values[i]) for i in present]
+            if self._executor is not None:
+                chunk_size = max(1, math.ceil(len(plaintexts) / self.encrypt_workers))
+                encrypted = self.cipher.encrypt_many(plaintexts, chunk_size=chunk_size, executor=self._executor)
+            else:
+                encrypted = self.cipher.encrypt_many(plaintexts)
+            for i, value in zip(present, encrypted):
+                values[i] = value.decode("ascii")
+        for column in self.epoch_columns:
+            columns[index[column]] = convert_epochs(columns[index[column]], self.epoch_format, self.epoch_tz)
+        return list(zip(*columns))
+
+    def _written_rows(self, first, stats):
+        batch = first
+        while batch is not _DONE:
+            stats.rows += len(batch)
+            stats.batches += 1
+            yield from batch
+            batch = self._get(self.transformed, stats)
+
+    def _write(self, stats):
+        first = self._get(self.transformed, stats)
+        if first is _DONE:
+            return []
+        return self.creator.create(self.format, rows=self._written_rows(first, stats), columns=self.columns,
+                                   apply_style=self.apply_style, chunk_size=self.batch_size)
+
+    def run(self) -> dict:
+        """
+        Runs the export and gives how it went. Each stage's busy_seconds is time spent working and
+        wait_seconds time spent waiting on the stage before it (or, for fetch/transform, on the one
+        after it when the queue is full). A stage with a lot of waiting is not the bottleneck.
+
+        e.g.
+            {'rows': 250000, 'seconds': 9.8, 'rows_per_second': 25510, 'files': ['exports/clients.xlsx'],
+             'stages': {'fetch': {'rows': 250000, 'batches': 50, 'busy_seconds': 2.1, 'wait_seconds': 7.6,
+                                  'rows_per_second': 119047}, 'transform': {...}, 'write': {...}}}
+
+        :return stats: rows, seconds, rows_per_second, files written and per stage stats
+        """
+        self.fetched = queue.Queue(maxsize=self.queue_size)
+        self.transformed = queue.Queue(maxsize=self.queue_size)
+        self._stop = threading.Event()
+        self._errors = []
+        self.columns = None
+        self.stats = {"fetch": StageStats(), "transform": StageStats(), "write": StageStats()}
+        if self.encrypt_columns and self.encrypt_workers:
+            self._executor = ProcessPoolExecutor(max_workers=self.encrypt_workers)
+
+        start = time.perf_counter()
+        threads = [threading.Thread(target=self._stage, args=(name, work), name=f"export-{name}", daemon=True)
+                   for name, work in (("fetch", self._fetch), ("transform", self._transform))]
+        for thread in threads:
+            thread.start()
+
+        paths = []
+        write_start = time.perf_counter()
+        try:
+            paths = self._write(self.stats["write"])
+        except _Stopped:
+            pass
+        except BaseException:
+            self._stop.set()
+            raise
+        finally:
+            write = self.stats["write"]
+            write.busy = time.perf_counter() - write_start - write.waiting
+            for thread in threads:
+                thread.join()
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+        if self._errors:
+            raise self._errors[0]
+
+        elapsed = time.perf_counter() - start
+        for name, stage in self.stats.items():
+            metrics.observe(f"export.{name}", stage.busy)
+        rows = self.stats["write"].rows
+        return {
+            "rows": rows,
+            "seconds": elapsed,
+            "rows_per_second": rows / elapsed if elapsed else 0.0,
+            "files": paths,
+            "stages": {name: stage.as_dict() for name, stage in self.stats.items()},
+        }
@@ -0,0 +1,166 @@
+"""
+Keeps an on-disk (SQLite) index of a directory tree so listing it again doesn't mean walking everything again.
+
+A folder's mtime only changes when files are added, removed or renamed in it, so on a rescan
+folders with the same mtime are not listed again, their entries come from the index.
+File sizes/mtimes are still checked (one stat each, no directory listing) to find modified files,
+pass check_files=False to skip that for a structure only rescan.
+
+index = FileIndex("/data/share", "/tmp/share_index.sqlite")
+changes = index.scan()          # first scan lists everything as added
+changes = index.scan()          # later scans only give what changed
+files = index.files(["csv"])    # same as get_dir_files, straight from the index
+"""
+
+import os
+import sqlite3
+import time
+
+# Folders modified this recently are listed again next scan, a change in the same mtime tick would be missed otherwise
+_RACY_NS = 2_000_000_000
+
+
+class FileIndex:
+    def __init__(self, root, index_path):
+        """
+        :param root: The directory to index.
+        :param index_path: SQLite file to keep the index in, best kept outside root.
+        """
+        self.root = os.path.abspath(root)
+        self.index_path = index_path
+        self.connection = sqlite3.connect(index_path)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, parent TEXT, mtime_ns INTEGER);
+            CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, dir TEXT, size INTEGER, mtime_ns INTEGER);
+            CREATE INDEX IF NOT EXISTS dirs_parent ON dirs (parent);
+            CREATE INDEX IF NOT EXISTS files_dir ON files (dir);
+        """)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @staticmethod
+    def _matches(path, types):
+        return not types or path.rpartition(".")[2].lower() in types
+
+    def files(self, file_types=[]) -> list:
+        """
+        Lists the indexed files without touching the disk. Run scan() first to bring the index up to date.
+
+        :param file_types: Extensions to keep e.g. ["py", "txt"], leave blank for no filters.
+        :return files: List of file paths.
+        """
+        types = {file_type.lower().lstrip(".") for file_type in file_types}
+        return [path for (path,) in self.connection.execute("SELECT path FROM files ORDER BY path")
+                if self._matches(path, types)]
+
+    def _list_dir(self, path):
+        files, subdirs = {}, []
+        with os.scandir(path) as iterator:
+            for entry in iterator:
+                try:
+                    if entry.is_dir():
+                        if not entry.is_symlink():
+                            subdirs.append(entry.path)
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except OSError:  # broken symlink
+                        stat = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                files[entry.path] = (stat.st_size, stat.st_mtime_ns)
+        return files, subdirs
+
+    def _remove_dir(self, path, removed):
+        """Drops a folder and everything under it from the index, adding its files to removed."""
+        like = path.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + os.sep + "%"
+        condition = "(dir = ? OR dir LIKE ? ESCAPE '\\')"
+        removed.extend(row[0] for row in self.connection.execute(f"SELECT path FROM files WHERE {condition}",
+                                                                 (path, like)))
+        self.connection.execute(f"DELETE FROM files WHERE {condition}", (path, like))
+        self.connection.execute("DELETE FROM dirs WHERE path = ? OR path LIKE ? ESCAPE '\\'", (path, like))
+
+    def scan(self, file_types=[], check_files=True) -> dict:
+        """
+        Brings the index up to date with the disk and gives what changed since the last scan.
+
+        :param file_types: Only report changes to these extensions (everything is still indexed).
+        :param check_files: Stat files in unchanged folders to find modified ones.
+        :return changes: {"added": [...], "removed": [...], "modified": [...]} lists of file paths.
+        """
+        types = {file_type.lower().lstrip(".") for file_type in file_types}
+        added, removed, modified = [], [], []
+        now_ns = time.time_ns()
+
+        with self.connection:
+            execute = self.connection.execute
+            known_dirs = dict(execute("SELECT path, mtime_ns FROM dirs"))
+            stack = [self.root]
+            while stack:
+                path = stack.pop()
+                try:
+                    mtime_ns = os.stat(path).st_mtime_ns
+                except OSError:
+                    self._remove_dir(path, removed)
+                    continue
+                indexed = {file_path: (size, file_mtime) for file_path, size, file_mtime in
+                           execute("SELECT path, size, mtime_ns FROM files WHERE dir = ?", (path,))}
+                indexed_subdirs = [row[0] for row in execute("SELECT path FROM dirs WHERE parent = ?", (path,))]
+
+                if known_dirs.get(path) == mtime_ns:
+                    # Same entries as last time, only check the files themselves
+                    if check_files:
+                        for file_path, old in indexed.items():
+                            try:
+                                stat = os.stat(file_path)
+                            except OSError:
+                                continue
+                            if (stat.st_size, stat.st_mtime_ns) != old:
+                                modified.append(file_path)
+                                execute("UPDATE files SET size = ?, mtime_ns = ? WHERE path = ?",
+                                        (stat.st_size, stat.st_mtime_ns, file_path))
+                    stack.extend(indexed_subdirs)
+                    continue
+
+                try:
+                    files, subdirs = self._list_dir(path)
+                except OSError:
+                    self._remove_dir(path, removed)
+                    continue
+
+                for file_path, current in files.items():
+                    old = indexed.get(file_path)
+                    if old is None:
+                        added.append(file_path)
+                    elif old != current:
+                        modified.append(file_path)
+                gone = [file_path for file_path in indexed if file_path not in files]
+                removed.extend(gone)
+                execute("DELETE FROM files WHERE dir = ?", (path,))
+                self.connection.executemany(
+                    "INSERT INTO files VALUES (?, ?, ?, ?)",
+                    ((file_path, path, size, file_mtime) for file_path, (size, file_mtime) in files.items())
+                )
+
+                current_subdirs = set(subdirs)
+                for subdir in indexed_subdirs:
+                    if subdir not in current_subdirs:
+                        self._remove_dir(subdir, removed)
+
+                stored_mtime = 0 if now_ns - mtime_ns < _RACY_NS else mtime_ns
+                execute("INSERT OR REPLACE INTO dirs VALUES (?, ?, ?)",
+                        (path, os.path.dirname(path) if path != self.root else None, stored_mtime))
+                stack.extend(subdirs)
+
+        return {
+            "added": [path for path in added if self._matches(path, types)],
+            "removed": [path for path in removed if self._matches(path, types)],
+            "modified": [path for path in modified if self._matches(path, types)],
+        }
@@ -0,0 +1,165 @@
+"""
+Opt-in timing and counters for the utilities, off by default.
+
+DatabaseConnector, ExcelCreator and AESCipher time their phases with metrics.span(...), while disabled
+that costs an attribute check and returns a shared do-nothing context manager, so leave it in hot paths.
+
+Anything that takes (kind, name, value, tags) can be an exporter, kind is "counter" or "histogram"
+(spans are histograms of seconds). InMemoryExporter keeps everything for tests or a quick look:
+
+from Metrics import metrics, InMemoryExporter
+exporter = InMemoryExporter()
+metrics.enable(exporter)
+db.run_sql_dict_output("SELECT * FROM Clients")
+print(exporter.summary())   # {'database.execute': {'count': 1, 'sum': 0.002, ...}, ...}
+metrics.disable()
+
+Names used: database.connect/execute/fetch/dict (+ database.queries, database.rows counters),
+excel.build/write/style (excel.save is the whole workbook including those),
+excel.flush (pending add_row rows turned into the DataFrame),
+aes.kdf/encrypt/decrypt/encrypt_many/decrypt_many (+ aes.key_cache_hits).
+"""
+
+import threading
+import time
+from contextlib import nullcontext
+
+_NOOP = nullcontext()
+
+
+class _Span:
+    __slots__ = ("registry", "name", "tags", "start")
+
+    def __init__(self, registry, name, tags):
+        self.registry = registry
+        self.name = name
+        self.tags = tags
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        tags = self.tags if exc_type is None else {**self.tags, "error": exc_type.__name__}
+        self.registry.observe(self.name, time.perf_counter() - self.start, **tags)
+
+
+class Metrics:
+    def __init__(self):
+        self.enabled = False
+        self.exporters = []
+        self._lock = threading.Lock()
+
+    def enable(self, *exporters):
+        """
+        Turns recording on, sending everything to the given exporters (added to any already there).
+
+        :param exporters: callables taking (kind, name, value, tags), e.g. an InMemoryExporter
+        """
+        with self._lock:
+            self.exporters = self.exporters + [exporter for exporter in exporters if exporter not in self.exporters]
+            self.enabled = True
+
+    def disable(self, *exporters):
+        """Removes the given exporters, or stops recording altogether if none are given (or none are left)."""
+        with self._lock:
+            self.exporters = [exporter for exporter in self.exporters if exporters and exporter not in exporters]
+            self.enabled = bool(self.exporters)
+
+    def _emit(self, kind, name, value, tags):
+        # Copied on change rather than locked, so emitting never waits on enable()/disable()
+        for exporter in self.exporters:
+            exporter(kind, name, value, tags)
+
+    def count(self, name, value=1, **tags):
+        """Adds value to a counter."""
+        if self.enabled:
+            self._emit("counter", name, value, tags)
+
+    def observe(self, name, value, **tags):
+        """Records one value (e.g. a duration or size) in a histogram."""
+        if self.enabled:
+            self._emit("histogram", name, value, tags)
+
+    def span(self, name, **tags):
+        """
+        Times a with block into the name histogram, in seconds. Spans that raise get an error tag.
+
+        with metrics.span("database.execute", database_type="sqlite"):
+            ...
+        """
+        if not self.enabled:
+            return _NOOP
+        return _Span(self, name, tags)
+
+    def timed(self, name, **tags):
+        """Decorator version of span()."""
+        def decorator(function):
+            def wrapper(*args, **kwargs):
+                with self.span(name, **tags):
+                    return function(*args, **kwargs)
+            wrapper.__name__ = function.__name__
+            wrapper.__doc__ = function.__doc__
+            return wrapper
+        return decorator
+
+
+class InMemoryExporter:
+    """Keeps every counter total and histogram value in memory, grouped by name (tags are not split out)."""
+
+    def __init__(self, keep_tags=False):
+        """
+        :param keep_tags: also keep each value's tags in self.events, as (kind, name, value, tags) tuples
+        """
+        self.keep_tags = keep_tags
+        self.counters = {}
+        self.histograms = {}
+        self.events = []
+        self._lock = threading.Lock()
+
+    def __call__(self, kind, name, value, tags):
+        with self._lock:
+            if kind == "counter":
+                self.counters[name] = self.counters.get(name, 0) + value
+            else:
+                self.histograms.setdefault(name, []).append(value)
+            if self.keep_tags:
+                self.events.append((kind, name, value, tags))
+
+    def reset(self):
+        with self._lock:
+            self.counters = {}
+            self.histograms = {}
+            self.events = []
+
+    @staticmethod
+    def _percentile(values, percent):
+        return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+    def summary(self) -> dict:
+        """
+        Counter totals, and count/sum/min/max/mean/p50/p95/p99 per histogram.
+
+        e.g.
+            {'database.queries': 3,
+             'database.execute': {'count': 3, 'sum': 0.0061, 'min': 0.0012, 'max': 0.0031, 'mean': 0.002, ...}}
+        """
+        with self._lock:
+            result = dict(self.counters)
+            for name, values in self.histograms.items():
+                values = sorted(values)
+                result[name] = {
+                    "count": len(values),
+                    "sum": sum(values),
+                    "min": values[0],
+                    "max": values[-1],
+                    "mean": sum(values) / len(values),
+                    "p50": self._percentile(values, 50),
+                    "p95": self._percentile(values, 95),
+                    "p99": self._percentile(values, 99),
+                }
+            return result
+
+
+# The registry the utilities report to
+metrics = Metrics()
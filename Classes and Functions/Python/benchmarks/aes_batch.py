@@ -0,0 +1,55 @@
+"""
+Compares items/second of AESCipher.encrypt()/decrypt() in a loop against encrypt_many()/decrypt_many(),
+in process and spread over a process pool.
+
+python benchmarks/aes_batch.py --items 200000 --size 32 --workers 4
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from AESCipher import AESCipher
+
+
+def timed(function):
+    start = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=100_000)
+    parser.add_argument("--size", type=int, default=32, help="bytes per item")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--chunk-size", type=int, default=10_000)
+    args = parser.parse_args()
+
+    aes = AESCipher(b"benchmark password", os.urandom(16))
+    items = [os.urandom(args.size) for _ in range(args.items)]
+
+    encrypted, loop_encrypt = timed(lambda: [aes.encrypt(item) for item in items])
+    _, loop_decrypt = timed(lambda: [aes.decrypt(item) for item in encrypted])
+    _, many_encrypt = timed(lambda: aes.encrypt_many(items))
+    _, many_decrypt = timed(lambda: aes.decrypt_many(encrypted))
+    _, pool_encrypt = timed(lambda: aes.encrypt_many(items, workers=args.workers, chunk_size=args.chunk_size))
+    decrypted, pool_decrypt = timed(lambda: aes.decrypt_many(encrypted, workers=args.workers,
+                                                             chunk_size=args.chunk_size))
+    assert decrypted == items
+
+    print(f"\n{args.items} items of {args.size} bytes")
+    print(f"{'method':<32}{'encrypt items/s':>18}{'decrypt items/s':>18}")
+    for name, encrypt_time, decrypt_time in (
+        ("encrypt()/decrypt() loop", loop_encrypt, loop_decrypt),
+        ("encrypt_many()/decrypt_many()", many_encrypt, many_decrypt),
+        (f"... workers={args.workers}", pool_encrypt, pool_decrypt),
+    ):
+        print(f"{name:<32}{args.items / encrypt_time:>18,.0f}{args.items / decrypt_time:>18,.0f}")
+
+
+if __name__ == "__main__":
+    main()
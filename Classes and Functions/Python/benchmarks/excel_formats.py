@@ -0,0 +1,77 @@
+"""
+Compares how fast ExcelCreator.create() writes each output format and how much memory it needs.
+
+python benchmarks/excel_formats.py --rows 200000
+
+Peak memory is measured with tracemalloc, so it only counts memory allocated through Python
+(pyarrow's own buffers are not included).
+"""
+
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ExcelCreator import ExcelCreator, OUTPUT_ENGINES
+
+COLUMNS = ["id", "name", "amount", "created"]
+
+
+def generate_rows(count):
+    start = datetime.datetime(2024, 1, 1)
+    for i in range(count):
+        yield i, f"client {i}", i * 1.25, start + datetime.timedelta(seconds=i)
+
+
+def run(format, rows, chunk_size, streaming, folder):
+    creator = ExcelCreator(folder, f"bench_{'stream' if streaming else 'frame'}", sheet_name="Data")
+    if not streaming:
+        creator.set_entire_data(list(generate_rows(rows)), columns=COLUMNS)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    if streaming:
+        paths = creator.create(format, rows=generate_rows(rows), columns=COLUMNS, chunk_size=chunk_size)
+    else:
+        paths = creator.create(format, chunk_size=chunk_size)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "format": format,
+        "mode": "rows" if streaming else "DataFrame",
+        "seconds": elapsed,
+        "rows_per_second": rows / elapsed if elapsed else 0.0,
+        "peak_mb": peak / 1024 / 1024,
+        "file_mb": sum(os.path.getsize(path) for path in paths) / 1024 / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--chunk-size", type=int, default=50_000)
+    parser.add_argument("--formats", nargs="+", default=["xlsx", *OUTPUT_ENGINES])
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        for format in args.formats:
+            for streaming in (False, True):
+                results.append(run(format, args.rows, args.chunk_size, streaming, folder))
+
+    print(f"\n{args.rows} rows x {len(COLUMNS)} columns")
+    print(f"{'format':<10}{'mode':<11}{'seconds':>9}{'rows/s':>12}{'peak MB':>10}{'file MB':>10}")
+    for result in results:
+        print(f"{result['format']:<10}{result['mode']:<11}{result['seconds']:>9.2f}"
+              f"{result['rows_per_second']:>12,.0f}{result['peak_mb']:>10.1f}{result['file_mb']:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""
+Benchmarks the paths the rest of our code leans on, to catch regressions between changes:
+DatabaseConnector.run_sql_dict_output (on SQLite), ExcelCreator.add_row/create_excel, AESCipher key
+derivation/encrypt/decrypt, get_dir_files, and the directory-to-plaintext scan and renderers.
+
+Every case generates its own data (the same data for the same --seed), --scale multiplies the sizes.
+Each case is timed over --repeat runs after a warm up run, reporting items/second and run latency
+percentiles. Peak memory comes from one more run under tracemalloc (kept apart so tracing doesn't
+slow the timed runs), so like excel_formats.py it only counts memory allocated through Python.
+
+python benchmarks/suite.py --output before.json
+python benchmarks/suite.py --output after.json --compare before.json
+python benchmarks/suite.py --only aes_encrypt excel_create --scale 5 --repeat 3
+python benchmarks/suite.py --only dir_scan --profile
+"""
+
+import argparse
+import contextlib
+import cProfile
+import datetime
+import io
+import json
+import os
+import platform
+import pstats
+import random
+import runpy
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from AESCipher import AESCipher
+from Database import DatabaseConnector
+from ExcelCreator import ExcelCreator
+from util_functions import get_dir_files
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+DIRECTORY_TO_PLAINTEXT = os.path.join(REPO_ROOT, "Scripts", "directory-to-plaintext", "directory-to-plaintext.py")
+
+COLUMNS = ["id", "name", "amount", "created"]
+
+# name -> (setup function, size at --scale 1)
+CASES = {}
+
+
+def case(name, size):
+    """
+    Registers a benchmark. The setup function gets (size, folder, rng), makes whatever data it needs
+    and returns (run, items): the function to time and how many items one run handles.
+    """
+    def register(setup):
+        CASES[name] = (setup, size)
+        return setup
+    return register
+
+
+def generate_rows(count, rng):
+    start = datetime.datetime(2024, 1, 1)
+    return [(i, f"client {rng.randrange(1_000_000)}", round(rng.uniform(0, 10_000), 2),
+             start + datetime.timedelta(seconds=i)) for i in range(count)]
+
+
+def generate_tree(folder, files, rng, fanout=8, depth=3):
+    """Makes `files` empty files spread over fanout**depth folders, with a mix of extensions."""
+    folders = [folder]
+    for _ in range(depth):
+        folders = [os.path.join(parent, f"dir{i}") for parent in folders for i in range(fanout)]
+    for path in folders:
+        os.makedirs(path, exist_ok=True)
+    for i in range(files):
+        extension = rng.choice(["txt", "csv", "py", "json", "log"])
+        open(os.path.join(rng.choice(folders), f"file{i}.{extension}"), "w").close()
+    return folder
+
+
+def load_directory_to_plaintext():
+    return runpy.run_path(DIRECTORY_TO_PLAINTEXT, run_name="directory_to_plaintext")
+
+
+@case("db_dict_output", 50_000)
+def db_dict_output(size, folder, rng):
+    path = os.path.join(folder, "bench.sqlite")
+    with contextlib.closing(sqlite3.connect(path)) as connection, connection:
+        connection.execute("CREATE TABLE bench (id INTEGER, name TEXT, amount REAL, created TEXT)")
+        connection.executemany("INSERT INTO bench VALUES (?, ?, ?, ?)",
+                               ((i, name, amount, str(created)) for i, name, amount, created
+                                in generate_rows(size, rng)))
+    database = DatabaseConnector(database=path, database_type="sqlite")
+    return lambda: database.run_sql_dict_output("SELECT * FROM bench"), size
+
+
+@case("excel_add_row", 50_000)
+def excel_add_row(size, folder, rng):
+    rows = generate_rows(size, rng)
+
+    def run():
+        creator = ExcelCreator(folder, "bench_add_row")
+        creator.set_entire_data([], columns=COLUMNS)
+        for row in rows:
+            creator.add_row(row)
+        return creator.data_frame
+
+    return run, size
+
+
+@case("excel_create", 20_000)
+def excel_create(size, folder, rng):
+    creator = ExcelCreator(folder, "bench_create")
+    creator.set_entire_data(generate_rows(size, rng), columns=COLUMNS)
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            creator.create_excel()
+
+    return run, size
+
+
+@case("aes_init", 5)
+def aes_init(size, folder, rng):
+    salts = [rng.randbytes(16) for _ in range(size)]
+    return lambda: [AESCipher(b"benchmark password", salt, use_cache=False) for salt in salts], size
+
+
+@case("aes_encrypt", 20_000)
+def aes_encrypt(size, folder, rng):
+    aes = AESCipher(b"benchmark password", rng.randbytes(16))
+    items = [rng.randbytes(64) for _ in range(size)]
+    return lambda: [aes.encrypt(item) for item in items], size
+
+
+@case("aes_decrypt", 20_000)
+def aes_decrypt(size, folder, rng):
+    aes = AESCipher(b"benchmark password", rng.randbytes(16))
+    encrypted = [aes.encrypt(rng.randbytes(64)) for _ in range(size)]
+    return lambda: [aes.decrypt(item) for item in encrypted], size
+
+
+@case("get_dir_files", 5_000)
+def dir_files(size, folder, rng):
+    tree = generate_tree(os.path.join(folder, "tree"), size, rng)
+    return lambda: get_dir_files(tree, ["txt", "csv"]), size
+
+
+@case("dir_scan", 5_000)
+def dir_scan(size, folder, rng):
+    tree = generate_tree(os.path.join(folder, "tree"), size, rng)
+    scan_tree = load_directory_to_plaintext()["scan_tree"]
+    return lambda: scan_tree(tree), size
+
+
+@case("dir_render", 5_000)
+def dir_render(size, folder, rng):
+    """Every format rendered from one scan, items are the lines written."""
+    module = load_directory_to_plaintext()
+    tree_path = generate_tree(os.path.join(folder, "tree"), size, rng)
+    tree = module["scan_tree"](tree_path)
+
+    def run():
+        with open(os.devnull, "w", encoding="utf-8") as devnull:
+            for format_selected in module["FORMATS"]:
+                module["write_lines"](module["render_lines"](format_selected, tree_path, tree), devnull)
+
+    lines = sum(1 for format_selected in module["FORMATS"]
+                for _ in module["render_lines"](format_selected, tree_path, tree))
+    return run, lines
+
+
+def percentile(values, percent):
+    """Linear interpolation between the closest ranks, values must be sorted."""
+    if len(values) == 1:
+        return values[0]
+    position = (len(values) - 1) * percent / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def measure(run, items, repeat):
+    run()  # warm up, also fills any caches the first run would
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    median = statistics.median(latencies)
+    return {
+        "items": items,
+        "runs": repeat,
+        "items_per_second": items / median if median else 0.0,
+        "latency_seconds": {
+            "min": latencies[0],
+            "p50": median,
+            "p90": percentile(latencies, 90),
+            "p99": percentile(latencies, 99),
+            "max": latencies[-1],
+            "mean": statistics.fmean(latencies),
+        },
+        "peak_memory_mb": peak / 1024 / 1024,
+    }
+
+
+def profile(name, run, top):
+    profiler = cProfile.Profile()
+    profiler.runcall(run)
+    print(f"\n--- {name} ---")
+    pstats.Stats(profiler).sort_stats("cumulative").print_stats(top)
+
+
+def print_results(results, previous):
+    header = f"{'case':<16}{'items':>10}{'items/s':>14}{'p50 s':>10}{'p90 s':>10}{'p99 s':>10}{'peak MB':>10}"
+    print("\n" + header + (f"{'vs p50':>10}" if previous else ""))
+    for name, result in results.items():
+        latency = result["latency_seconds"]
+        line = (f"{name:<16}{result['items']:>10,}{result['items_per_second']:>14,.0f}{latency['p50']:>10.4f}"
+                f"{latency['p90']:>10.4f}{latency['p99']:>10.4f}{result['peak_memory_mb']:>10.1f}")
+        old = previous.get(name)
+        if old is not None and old["items"] == result["items"]:
+            line += f"{(latency['p50'] / old['latency_seconds']['p50'] - 1) * 100:>+9.1f}%"
+        elif previous:
+            line += f"{'-':>10}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", nargs="+", choices=list(CASES), default=list(CASES), metavar="CASE",
+                        help=f"Cases to run: {', '.join(CASES)}")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplies every case's data size")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per case")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Save the results as JSON")
+    parser.add_argument("--compare", help="JSON from an earlier run to compare the median latency against")
+    parser.add_argument("--profile", action="store_true", help="Also print a cProfile of one run of each case")
+    parser.add_argument("--profile-top", type=int, default=15)
+    args = parser.parse_args()
+
+    previous = {}
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            previous = json.load(f)["results"]
+
+    results = {}
+    for name in args.only:
+        setup, size = CASES[name]
+        size = max(1, int(size * args.scale))
+        with tempfile.TemporaryDirectory() as folder:
+            run, items = setup(size, folder, random.Random(args.seed))
+            print(f"{name}: {items:,} items...", file=sys.stderr)
+            results[name] = measure(run, items, args.repeat)
+            if args.profile:
+                profile(name, run, args.profile_top)
+
+    print_results(results, previous)
+
+    if args.output:
+        report = {
+            "meta": {
+                "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+                "python": sys.version.split()[0],
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "scale": args.scale,
+                "repeat": args.repeat,
+                "seed": args.seed,
+            },
+            "results": results,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
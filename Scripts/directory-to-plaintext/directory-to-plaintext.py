@@ -1,8 +1,19 @@
 import os
+import sys
 import json
+import html
+from xml.sax.saxutils import quoteattr
+import argparse
 import tkinter as tk
 from tkinter import filedialog, messagebox, scrolledtext
 import hashlib
+import threading
+import time
+import ctypes
+import ctypes.util
+import select
+import struct
+from collections import OrderedDict
 
 # Simple tooltip class for Tkinter widgets
 class ToolTip:
@@ -58,209 +69,838 @@ class ToolTip:
 
 
 
-def safe_listdir(path):
+class FolderWatcher:
+    """
+    Collects the folders whose contents change (files/folders added, removed or renamed).
+    Uses inotify on Linux, anywhere else (or if inotify runs out of watches) it polls
+    just the folders' mtimes every poll_interval seconds instead of hashing the whole tree.
+    """
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    WATCH_MASK = IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+
+    def __init__(self, path, poll_interval=2.0):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.lock = threading.Lock()
+        self.pending = set()
+        self.last_event = 0.0
+        self.stopped = threading.Event()
+        self.watches = {}  # inotify watch descriptor -> folder
+        self.mtimes = {}  # folder -> mtime, when polling
+        self.fd = self._inotify_init()
+        self.thread = threading.Thread(target=self._inotify_loop if self.fd is not None else self._poll_loop,
+                                       daemon=True)
+        self.started = False
+
+    @staticmethod
+    def _inotify_init():
+        # inotify is Linux only, everywhere else (Windows, macOS) polls
+        if not sys.platform.startswith("linux"):
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | getattr(os, "O_CLOEXEC", 0))
+        except (OSError, AttributeError, TypeError):
+            return None
+        if fd < 0:
+            return None
+        FolderWatcher.libc = libc
+        return fd
+
+    def start(self):
+        self.started = True
+        self.thread.start()
+
+    def _fall_back_to_polling(self):
+        fd, self.fd = self.fd, None
+        self.thread = threading.Thread(target=self._poll_loop, daemon=True)
+        if self.started:
+            # The inotify thread sees fd is gone and closes it
+            self.thread.start()
+        else:
+            os.close(fd)
+
+    def stop(self):
+        self.stopped.set()
+        if not self.started and self.fd is not None:
+            # Once started the inotify thread closes it
+            os.close(self.fd)
+            self.fd = None
+
+    def _changed(self, folder):
+        with self.lock:
+            self.pending.add(folder)
+            self.last_event = time.monotonic()
+
+    def watch(self, folders, cancel=None):
+        """
+        Starts watching folders (not recursive, pass every folder in the tree).
+        That is a syscall per folder, so it stops with Cancelled once cancel is set.
+        """
+        for count, folder in enumerate(folders):
+            if count % 1000 == 0:
+                check_cancelled(cancel)
+            if self.fd is not None:
+                wd = self.libc.inotify_add_watch(self.fd, os.fsencode(folder), self.WATCH_MASK)
+                if wd >= 0:
+                    self.watches[wd] = folder
+                    continue
+                # Usually out of watches (fs.inotify.max_user_watches), carry on by polling
+                self._fall_back_to_polling()
+                with self.lock:
+                    self.mtimes.update((watched, 0) for watched in self.watches.values())
+            try:
+                mtime = os.stat(folder).st_mtime_ns
+            except OSError:
+                continue
+            with self.lock:
+                self.mtimes[folder] = mtime
+
+    def take_changes(self, debounce=0.5):
+        """
+        Returns the folders that changed once nothing else has changed for `debounce` seconds,
+        so a big copy results in one update rather than hundreds. Returns an empty set until then.
+        """
+        with self.lock:
+            if not self.pending or time.monotonic() - self.last_event < debounce:
+                return set()
+            changes, self.pending = self.pending, set()
+            return changes
+
+    def _inotify_loop(self):
+        fd = self.fd
+        header = struct.Struct("iIII")
+        while not self.stopped.is_set() and self.fd is not None:
+            readable, _, _ = select.select([fd], [], [], 0.5)
+            if not readable:
+                continue
+            try:
+                data = os.read(fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = header.unpack_from(data, offset)
+                offset += header.size + length
+                if mask & self.IN_Q_OVERFLOW:
+                    # Events were dropped, the whole tree has to be checked
+                    self._changed(self.path)
+                elif mask & self.IN_IGNORED:
+                    self.watches.pop(wd, None)
+                elif wd in self.watches:
+                    folder = self.watches[wd]
+                    if mask & (self.IN_DELETE_SELF | self.IN_MOVE_SELF):
+                        folder = os.path.dirname(folder) if folder != self.path else folder
+                    self._changed(folder)
+        os.close(fd)
+
+    def _poll_loop(self):
+        while not self.stopped.wait(self.poll_interval):
+            with self.lock:
+                folders = list(self.mtimes.items())
+            for folder, mtime in folders:
+                try:
+                    current = os.stat(folder).st_mtime_ns
+                except OSError:
+                    with self.lock:
+                        self.mtimes.pop(folder, None)
+                    self._changed(os.path.dirname(folder) if folder != self.path else folder)
+                    continue
+                if current != mtime:
+                    with self.lock:
+                        self.mtimes[folder] = current
+                    self._changed(folder)
+
+
+class Node:
+    """One entry of a scanned folder, children is a list (sorted by name) for folders and None for files."""
+    __slots__ = ("name", "parent", "is_dir", "size", "mtime", "children")
+
+    def __init__(self, name, parent=None, is_dir=False, size=0, mtime=0.0):
+        self.name = name
+        self.parent = parent
+        self.is_dir = is_dir
+        self.size = size
+        self.mtime = mtime
+        self.children = [] if is_dir else None
+
+def scan_children(path, parent):
+    """
+    Lists one folder with scandir, one stat per entry and no extra isdir calls.
+    Gives the sorted children and the folders among them to scan next, symlinked folders are
+    shown as folders but not followed as they could loop back on themselves.
+    """
+    children, subfolders = [], []
     try:
-        return sorted(os.listdir(path))
+        with os.scandir(path) as iterator:
+            for entry in iterator:
+                try:
+                    stat = entry.stat()
+                    node = Node(entry.name, parent, entry.is_dir(), stat.st_size, stat.st_mtime)
+                except OSError:  # broken symlink, or removed since the listing
+                    node = Node(entry.name, parent)
+                if node.is_dir and not entry.is_symlink():
+                    subfolders.append(node)
+                children.append(node)
     except Exception as e:
-        return [f"[Error reading {path}: {e}]"]
+        return [Node(f"[Error reading {path}: {e}]", parent)], []
+    children.sort(key=lambda node: node.name)
+    return children, subfolders
 
-def get_folder_tree_raw(path):
-    return [os.path.join(root, name) for root, dirs, files in os.walk(path) for name in dirs + files]
+class Cancelled(Exception):
+    """Raised inside a scan or render once its cancel event is set."""
 
-def build_tree_json(path):
-    tree = {}
-    for item in safe_listdir(path):
-        full_path = os.path.join(path, item)
-        if os.path.isdir(full_path):
-            tree[item] = build_tree_json(full_path)
-        else:
-            tree[item] = None
-    return tree
+def check_cancelled(cancel):
+    if cancel is not None and cancel.is_set():
+        raise Cancelled()
+
+def scan_tree(path, node=None, progress=None, cancel=None):
+    """
+    Scans a folder once into a tree of Nodes, the raw list, JSON tree and fingerprint are all built from it.
+    Pass node to fill in an existing folder Node instead of making a new root.
 
-def hash_folder_content(path):
+    :param progress: Called with the number of entries scanned so far after each folder.
+    :param cancel: threading.Event, the scan stops with Cancelled once it is set.
     """
-    Generate a hash representing the folder content for change detection.
-    It walks the folder and hashes paths + file modification times.
+    if node is None:
+        node = Node(os.path.basename(path) or path, None, True)
+    scanned = 0
+    stack = [(path, node)]
+    while stack:
+        check_cancelled(cancel)
+        folder, folder_node = stack.pop()
+        folder_node.children, subfolders = scan_children(folder, folder_node)
+        stack.extend((os.path.join(folder, child.name), child) for child in subfolders)
+        scanned += len(folder_node.children)
+        if progress is not None:
+            progress(scanned)
+    return node
+
+def walk_tree(path, tree):
+    """Yields (folder path, folder Node) top-down in the same order as os.walk."""
+    stack = [(path, tree)]
+    while stack:
+        folder, node = stack.pop()
+        yield folder, node
+        stack.extend(reversed([(os.path.join(folder, child.name), child)
+                               for child in node.children if child.is_dir]))
+
+def tree_folders(path, tree):
+    """Yields every folder path in a scanned tree, path itself first."""
+    for folder, node in walk_tree(path, tree):
+        yield folder
+
+def iter_raw(path, tree):
+    """Every path under the folder, folders before files in each folder like os.walk gives them."""
+    for folder, node in walk_tree(path, tree):
+        for child in node.children:
+            if child.is_dir:
+                yield os.path.join(folder, child.name)
+        for child in node.children:
+            if not child.is_dir:
+                yield os.path.join(folder, child.name)
+
+def tree_fingerprint(path, tree):
+    """
+    Hash of the paths + modification times + sizes in the tree, for change detection.
+    Uses the values from the scan so nothing is read from the disk again.
     """
     hash_md5 = hashlib.md5()
-    for root, dirs, files in os.walk(path):
-        for name in sorted(dirs + files):
-            full_path = os.path.join(root, name)
-            try:
-                stat = os.stat(full_path)
-                hash_md5.update(full_path.encode('utf-8'))
-                hash_md5.update(str(stat.st_mtime).encode('utf-8'))
-                hash_md5.update(str(stat.st_size).encode('utf-8'))
-            except Exception:
-                continue
+    for folder, node in walk_tree(path, tree):
+        for child in node.children:
+            hash_md5.update(os.path.join(folder, child.name).encode('utf-8', 'surrogateescape'))
+            hash_md5.update(str(child.mtime).encode('utf-8'))
+            hash_md5.update(str(child.size).encode('utf-8'))
     return hash_md5.hexdigest()
 
-def update_output(*args):
+def find_node(path, tree, folder):
+    """The folder Node for a path under the scanned folder, None if it isn't in the tree."""
+    rel = os.path.relpath(folder, path)
+    node = tree
+    if rel != ".":
+        for part in rel.split(os.sep):
+            node = next((child for child in node.children if child.name == part and child.is_dir), None)
+            if node is None:
+                return None
+    return node
+
+def update_tree(path, tree, changed_folders, watcher=None):
+    """
+    Updates a scanned tree in place, re-listing only the changed folders.
+    Folders that are new get scanned (and watched), unchanged subfolders are kept as they are.
+    """
+    # Parents first, so a folder removed from its parent is skipped rather than re-listed
+    for folder in sorted(changed_folders, key=len):
+        node = find_node(path, tree, folder)
+        if node is None:
+            continue
+
+        try:
+            stat = os.stat(folder)
+        except OSError:
+            node.children = []
+            continue
+        node.size, node.mtime = stat.st_size, stat.st_mtime
+        old_folders = {child.name: child for child in node.children if child.is_dir}
+        children, subfolders = scan_children(folder, node)
+        for child in subfolders:
+            old = old_folders.get(child.name)
+            if old is not None:
+                child.children = old.children
+                for grandchild in child.children:
+                    grandchild.parent = child
+            else:
+                full_path = os.path.join(folder, child.name)
+                if watcher is not None:
+                    watcher.watch([full_path])
+                scan_tree(full_path, child)
+                if watcher is not None:
+                    watcher.watch(list(tree_folders(full_path, child))[1:])
+        node.children = children
+
+FORMATS = ["Raw", "Plaintext", "Markdown", "JSON", "CSV", "HTML", "XML"]
+PAGE_LINES = 2000  # lines put in the text widget at once
+
+def tree_caches(path, tree, cancel=None):
+    """What the GUI keeps for a scanned folder, the formats are rendered straight from the tree."""
+    check_cancelled(cancel)
+    return {"tree": tree, "hash": tree_fingerprint(path, tree)}
+
+def refresh_cache(folder_path, progress=None, cancel=None, watch=False):
+    """
+    Scans the folder and builds the caches from it, the slow part so the GUI runs it on a worker thread.
+    With watch the caches also get a "watcher", a FolderWatcher (not started yet) already watching
+    every folder in the tree, as adding the watches takes a while on big trees too.
+    """
+    tree = scan_tree(folder_path, progress=progress, cancel=cancel)
+    caches = tree_caches(folder_path, tree, cancel)
+    if watch:
+        watcher = FolderWatcher(folder_path)
+        try:
+            watcher.watch(tree_folders(folder_path, tree), cancel)
+        except BaseException:
+            watcher.stop()
+            raise
+        caches["watcher"] = watcher
+    return caches
+
+def tree_events(tree):
+    """
+    Walks the tree depth first without recursion, yielding (node, depth, last, opening).
+    Files come once with opening=None, folders twice: opening=True before their children and False after.
+    depth is 0 for the scanned folder's own entries and last is whether the node is the last in its folder.
+    """
+    stack = [[tree, 0]]
+    while stack:
+        frame = stack[-1]
+        node, i = frame
+        if i == len(node.children):
+            stack.pop()
+            if stack:
+                parent, index = stack[-1]
+                yield node, len(stack) - 1, index == len(parent.children), False
+            continue
+        frame[1] = i + 1
+        child = node.children[i]
+        last = i + 1 == len(node.children)
+        if child.is_dir:
+            yield child, len(stack) - 1, last, True
+            stack.append([child, 0])
+        else:
+            yield child, len(stack) - 1, last, None
+
+def render_raw(folder_path, tree):
+    yield "["
+    previous = None
+    for path in iter_raw(folder_path, tree):
+        if previous is not None:
+            yield f"    {previous!r},"
+        previous = path
+    if previous is not None:
+        yield f"    {previous!r}"
+    yield "]"
+
+def render_csv(folder_path, tree):
+    return iter_raw(folder_path, tree)
+
+def render_plaintext(folder_path, tree):
+    yield os.path.basename(folder_path)
+    indents = [""]
+    for node, depth, last, opening in tree_events(tree):
+        if opening is False:
+            indents.pop()
+            continue
+        yield indents[-1] + ("└── " if last else "├── ") + node.name
+        if opening:
+            indents.append(indents[-1] + ("    " if last else "│   "))
+
+def render_markdown(folder_path, tree):
+    yield "# " + os.path.basename(folder_path)
+    for node, depth, last, opening in tree_events(tree):
+        if opening is not False:
+            yield f"{'  ' * depth}- {node.name}"
+
+def render_json(folder_path, tree):
+    """
+    {folder name: {...}} with folders as nested objects and files as null, the same text
+    json.dumps(..., indent=2) would give, a line at a time.
+    """
+    name = json.dumps(os.path.basename(folder_path))
+    if not tree.children:
+        yield f"{{\n  {name}: {{}}\n}}"
+        return
+    yield "{"
+    yield f"  {name}: {{"
+    for node, depth, last, opening in tree_events(tree):
+        indent = "  " * (depth + 2)
+        comma = "" if last else ","
+        if opening is None:
+            yield f"{indent}{json.dumps(node.name)}: null{comma}"
+        elif opening and not node.children:
+            yield f"{indent}{json.dumps(node.name)}: {{}}{comma}"
+        elif opening:
+            yield f"{indent}{json.dumps(node.name)}: {{"
+        elif node.children:
+            yield f"{indent}}}{comma}"
+    yield "  }"
+    yield "}"
+
+def render_html(folder_path, tree):
+    yield "<ul>"
+    for node, depth, last, opening in tree_events(tree):
+        indent = "    " * depth
+        if opening is None:
+            yield f"{indent}  <li>{html.escape(node.name)}</li>"
+        elif opening:
+            yield f"{indent}  <li>{html.escape(node.name)}"
+            yield f"{indent}    <ul>"
+        else:
+            yield f"{indent}    </ul>"
+            yield f"{indent}  </li>"
+    yield "</ul>"
+
+def render_xml(folder_path, tree):
+    yield f"<folder name={quoteattr(os.path.basename(folder_path))}>"
+    for node, depth, last, opening in tree_events(tree):
+        indent = "  " * (depth + 1)
+        if opening is None:
+            yield f"{indent}<file name={quoteattr(node.name)} />"
+        elif opening:
+            yield f"{indent}<folder name={quoteattr(node.name)}>"
+        else:
+            yield f"{indent}</folder>"
+    yield "</folder>"
+
+RENDERERS = {
+    "Raw": render_raw,
+    "Plaintext": render_plaintext,
+    "Markdown": render_markdown,
+    "JSON": render_json,
+    "CSV": render_csv,
+    "HTML": render_html,
+    "XML": render_xml,
+}
+
+def render_lines(format_selected, folder_path, tree, cancel=None):
+    """
+    Yields the output in one of FORMATS a line at a time, so even a huge tree never has to be
+    held as one string. Stops with Cancelled once cancel is set.
+    """
+    if format_selected not in RENDERERS:
+        yield "Unknown format selected."
+        return
+    for count, line in enumerate(RENDERERS[format_selected](folder_path, tree)):
+        if count % 1000 == 0:
+            check_cancelled(cancel)
+        yield line
+
+def write_lines(lines, f, batch_size=1000):
+    """Writes rendered lines to a file object (or sys.stdout) as they come."""
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= batch_size:
+            f.write("\n".join(batch) + "\n")
+            batch = []
+    if batch:
+        f.write("\n".join(batch) + "\n")
+
+class RenderCache:
+    """
+    Rendered lines keyed on (format, tree fingerprint), so switching back to a format that was
+    already rendered is instant. The least recently used renders are dropped once their
+    (estimated) size passes max_bytes. Thread safe, renders are stored from the worker thread.
+    """
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # (format, fingerprint) -> (lines, size)
+        self.size = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def estimate_size(lines):
+        return sys.getsizeof(lines) + sum(sys.getsizeof(line) for line in lines)
+
+    def get(self, format_selected, fingerprint):
+        with self.lock:
+            entry = self.entries.get((format_selected, fingerprint))
+            if entry is None:
+                return None
+            self.entries.move_to_end((format_selected, fingerprint))
+            return entry[0]
+
+    def put(self, format_selected, fingerprint, lines):
+        size = self.estimate_size(lines)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop((format_selected, fingerprint), None)
+            if old is not None:
+                self.size -= old[1]
+            self.entries[(format_selected, fingerprint)] = (lines, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.size -= evicted
+
+    def invalidate(self, fingerprint=None):
+        """Drops the renders of a tree that changed, or everything when fingerprint is None."""
+        with self.lock:
+            for key in [key for key in self.entries if fingerprint is None or key[1] == fingerprint]:
+                self.size -= self.entries.pop(key)[1]
+
+class BackgroundTask:
+    """
+    Runs work(progress, cancel) on a worker thread so the window doesn't hang on big folders.
+    Tk isn't thread safe, so the worker only stores its progress and result and the
+    Tk thread picks them up with widget.after. A cancelled task never calls back.
+    """
+    def __init__(self, widget, work, on_done, on_progress=None, on_error=None, poll_ms=100):
+        self.widget = widget
+        self.on_done = on_done
+        self.on_progress = on_progress
+        self.on_error = on_error
+        self.poll_ms = poll_ms
+        self.cancel_event = threading.Event()
+        self.finished = threading.Event()
+        self.progress = None
+        self.result = None
+        self.error = None
+        self.thread = threading.Thread(target=self._run, args=(work,), daemon=True)
+        self.thread.start()
+        widget.after(poll_ms, self._poll)
+
+    def _run(self, work):
+        try:
+            self.result = work(self._set_progress, self.cancel_event)
+        except Cancelled:
+            pass
+        except Exception as e:
+            self.error = e
+        self.finished.set()
+
+    def _set_progress(self, value):
+        self.progress = value
+
+    @property
+    def running(self):
+        return not self.finished.is_set() and not self.cancel_event.is_set()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def _poll(self):
+        if self.cancel_event.is_set():
+            return
+        progress, self.progress = self.progress, None
+        if progress is not None and self.on_progress is not None:
+            self.on_progress(progress)
+        if not self.finished.is_set():
+            self.widget.after(self.poll_ms, self._poll)
+        elif self.error is not None:
+            if self.on_error is not None:
+                self.on_error(self.error)
+        else:
+            self.on_done(self.result)
+
+def run_task(kind, work, on_done, on_progress=None):
+    """Starts a BackgroundTask, cancelling the last one of the same kind ("scan" or "render")."""
+    if tasks[kind] is not None:
+        tasks[kind].cancel()
+    tasks[kind] = BackgroundTask(root, work, on_done, on_progress, on_task_error)
+
+def on_task_error(error):
+    status_label.config(text=f"Error: {error}")
+
+def update_output(*args, status=None, keep_page=False):
     if not selected_folder[0]:
         copy_button.config(state="disabled")
         status_label.config(text="No folder selected")
         return
+    scan = tasks["scan"]
+    if scan is not None and scan.running:
+        return  # the scan shows the chosen format when it's done
 
     folder_path = selected_folder[0]
-    base_name = os.path.basename(folder_path)
     format_selected = format_var.get()
-
-    raw_paths = folder_tree_cache["raw"]
-    tree_json = folder_tree_cache["json"]
-
-    if format_selected == "Raw":
-        output = "[\n" + ",\n".join(f"    {repr(p)}" for p in raw_paths) + "\n]"
-    elif format_selected == "Plaintext":
-        def text_tree(json_tree, indent=""):
-            lines = []
-            items = list(json_tree.items())
-            for i, (name, subtree) in enumerate(items):
-                prefix = "└── " if i == len(items) - 1 else "├── "
-                lines.append(indent + prefix + name)
-                if subtree is not None:
-                    extension = "    " if i == len(items) - 1 else "│   "
-                    lines.extend(text_tree(subtree, indent + extension))
-            return lines
-        output = "\n".join([base_name] + text_tree(tree_json))
-    elif format_selected == "Markdown":
-        def md_tree(json_tree, level=0):
-            lines = []
-            for name, subtree in json_tree.items():
-                lines.append(f"{'  ' * level}- {name}")
-                if subtree is not None:
-                    lines.extend(md_tree(subtree, level + 1))
-            return lines
-        output = "\n".join(["# " + base_name] + md_tree(tree_json))
-    elif format_selected == "JSON":
-        output = json.dumps({base_name: tree_json}, indent=2)
-    elif format_selected == "CSV":
-        output = "\n".join(raw_paths)
-    elif format_selected == "HTML":
-        def html_tree(json_tree):
-            html_parts = ["<ul>"]
-            for name, subtree in json_tree.items():
-                html_parts.append(f"<li>{name}")
-                if subtree is not None:
-                    html_parts.append(html_tree(subtree))
-                html_parts.append("</li>")
-            html_parts.append("</ul>")
-            return "".join(html_parts)
-        output = html_tree(tree_json)
-    elif format_selected == "XML":
-        def xml_tree(name, subtree, indent="  "):
-            lines = [f'{indent}<folder name="{name}">']
-            for child_name, child_tree in subtree.items():
-                if child_tree is None:
-                    lines.append(f'{indent}  <file name="{child_name}" />')
-                else:
-                    lines.extend(xml_tree(child_name, child_tree, indent + "  "))
-            lines.append(f'{indent}</folder>')
-            return lines
-        output = "\n".join([f'<folder name="{base_name}">'] + xml_tree(base_name, tree_json, "  ")[1:])
-    else:
-        output = "Unknown format selected."
-
+    tree = folder_tree_cache["tree"]
+    fingerprint = folder_tree_cache["hash"]
+
+    def render(progress, cancel):
+        lines = list(render_lines(format_selected, folder_path, tree, cancel))
+        render_cache.put(format_selected, fingerprint, lines)
+        return lines
+
+    def show(lines):
+        shown_output["lines"] = lines
+        show_page(shown_output["start"] if keep_page else 0)
+        copy_button.config(state="normal")
+        status_label.config(text=status or f"Folder: {folder_path}")
+
+    lines = render_cache.get(format_selected, fingerprint)
+    if lines is not None:
+        if tasks["render"] is not None:
+            tasks["render"].cancel()
+        show(lines)
+        return
+    status_label.config(text=f"Rendering {format_selected}...")
+    run_task("render", render, show)
+
+def set_tree_cache(folder_path, caches):
+    """Stores a new scan, dropping the renders of the old one if the same folder changed."""
+    if folder_path == folder_tree_cache.get("folder") and caches["hash"] != folder_tree_cache["hash"]:
+        render_cache.invalidate(folder_tree_cache["hash"])
+    folder_tree_cache.update(caches, folder=folder_path)
+
+def show_page(start):
+    """Only PAGE_LINES lines go into the text widget at a time, Tk crawls with hundreds of thousands."""
+    lines = shown_output["lines"]
+    start = max(0, min(start, (len(lines) - 1) // PAGE_LINES * PAGE_LINES))
+    end = min(start + PAGE_LINES, len(lines))
+    shown_output["start"] = start
     text_area.config(state=tk.NORMAL)
     text_area.delete("1.0", tk.END)
-    text_area.insert(tk.END, output)
+    text_area.insert(tk.END, "\n".join(lines[start:end]))
     text_area.config(state=tk.DISABLED)
-    copy_button.config(state="normal")
-    status_label.config(text=f"Folder: {folder_path}")
+    page_label.config(text=f"Lines {start + 1:,}-{end:,} of {len(lines):,}" if lines else "")
+    prev_button.config(state="normal" if start > 0 else "disabled")
+    next_button.config(state="normal" if end < len(lines) else "disabled")
+
+def previous_page():
+    show_page(shown_output["start"] - PAGE_LINES)
+
+def next_page():
+    show_page(shown_output["start"] + PAGE_LINES)
 
 def select_folder():
     folder_path = filedialog.askdirectory()
     if folder_path:
         selected_folder[0] = folder_path
-        refresh_cache()
-        update_output()
-        start_auto_refresh()
+        if folder_watcher[0] is not None:
+            folder_watcher[0].stop()
+            folder_watcher[0] = None
+        if tasks["render"] is not None:
+            tasks["render"].cancel()
+
+        def scanned(caches):
+            watcher = caches.pop("watcher")
+            set_tree_cache(folder_path, caches)
+            update_output()
+            start_auto_refresh(watcher)
 
-def refresh_cache():
-    folder_path = selected_folder[0]
-    if folder_path:
-        folder_tree_cache["raw"] = get_folder_tree_raw(folder_path)
-        folder_tree_cache["json"] = build_tree_json(folder_path)
-        folder_tree_cache["hash"] = hash_folder_content(folder_path)
+        def show_progress(count):
+            status_label.config(text=f"Scanning {folder_path}... {count:,} entries")
+
+        status_label.config(text=f"Scanning {folder_path}...")
+        run_task("scan", lambda progress, cancel: refresh_cache(folder_path, progress, cancel, watch=True),
+                 scanned, show_progress)
 
 def auto_refresh_check():
     folder_path = selected_folder[0]
-    if folder_path:
-        current_hash = hash_folder_content(folder_path)
-        if current_hash != folder_tree_cache.get("hash"):
-            refresh_cache()
-            update_output()
-            status_label.config(text=f"Folder changed: {folder_path} (Auto-refreshed)")
-    root.after(5000, auto_refresh_check)
+    watcher = folder_watcher[0]
+    scan = tasks["scan"]
+    if folder_path and watcher is not None and (scan is None or not scan.running):
+        changed = watcher.take_changes()
+        if changed:
+            tree = folder_tree_cache["tree"]
+            # update_tree changes the tree in place, so a render still walking it has to stop first.
+            # New renders wait too, update_output does nothing while the scan task runs
+            render = tasks["render"]
+            if render is not None:
+                render.cancel()
+            saves = [task for task in save_tasks if not task.finished.is_set()]
+
+            def rescan(progress, cancel):
+                if render is not None:
+                    render.thread.join()
+                # Files being saved are rendered from the tree too, those are let finish
+                for task in saves:
+                    task.thread.join()
+                update_tree(folder_path, tree, changed, watcher)
+                return tree_caches(folder_path, tree, cancel)
+
+            def rescanned(caches):
+                set_tree_cache(folder_path, caches)
+                update_output(status=f"Folder changed: {folder_path} (Auto-refreshed)", keep_page=True)
+
+            run_task("scan", rescan, rescanned)
+    root.after(250, auto_refresh_check)
+
+def start_auto_refresh(watcher):
+    """Starts a watcher from refresh_cache(watch=True), its watches are already in place."""
+    if folder_watcher[0] is not None:
+        folder_watcher[0].stop()
+    watcher.start()
+    folder_watcher[0] = watcher
 
-def start_auto_refresh():
     if not getattr(root, "_auto_refresh_running", False):
         root._auto_refresh_running = True
-        root.after(5000, auto_refresh_check)
+        root.after(250, auto_refresh_check)
 
 def copy_to_clipboard():
-    content = text_area.get("1.0", tk.END).strip()
+    content = "\n".join(shown_output["lines"]).strip()
     if content:
         root.clipboard_clear()
         root.clipboard_append(content)
         messagebox.showinfo("Copied", "Text copied to clipboard!")
 
 def save_to_file():
-    content = text_area.get("1.0", tk.END).strip()
-    if not content:
+    tree = folder_tree_cache["tree"]
+    if tree is None:
         messagebox.showwarning("No Content", "There is no content to save.")
         return
+    scan = tasks["scan"]
+    if scan is not None and scan.running:
+        # A rescan changes the tree in place, it can't be saved from halfway through
+        messagebox.showwarning("Scanning", "The folder is still being scanned, save once it's done.")
+        return
+    folder_path = folder_tree_cache["folder"]
+    format_selected = format_var.get()
     file_path = filedialog.asksaveasfilename(defaultextension=".txt",
                                              filetypes=[("Text files", "*.txt"), ("All files", "*.*")])
     if file_path:
-        try:
+        def save(progress, cancel):
+            # Rendered straight into the file, the whole output is never held at once
             with open(file_path, "w", encoding="utf-8") as f:
-                f.write(content)
-            messagebox.showinfo("Saved", f"Output saved to {file_path}")
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to save file:\n{e}")
-
-# GUI Setup
-root = tk.Tk()
-root.title("Folder Tree Viewer")
-root.minsize(700, 600)
-
-selected_folder = [None]
-folder_tree_cache = {"raw": [], "json": {}, "hash": None}
-
-# Use a nicer font for entire app
-default_font = ("Segoe UI", 10)
-
-frame = tk.Frame(root, padx=20, pady=10)
-frame.pack(fill=tk.X)
-
-btn_select = tk.Button(frame, text="Select Folder", command=select_folder, font=default_font)
-btn_select.pack(side=tk.LEFT)
-ToolTip(btn_select, "Select a folder to display its tree structure")
-
-tk.Label(frame, text="Output Format:", font=default_font).pack(side=tk.LEFT, padx=(20, 5))
-
-format_var = tk.StringVar(value="Plaintext")
-formats = ["Raw", "Plaintext", "Markdown", "JSON", "CSV", "HTML", "XML"]
-for fmt in formats:
-    rb = tk.Radiobutton(frame, text=fmt, variable=format_var, value=fmt, command=update_output, font=default_font)
-    rb.pack(side=tk.LEFT, padx=5)
-
-text_area = scrolledtext.ScrolledText(root, wrap=tk.WORD, width=90, height=30, font=("Consolas", 11),
-                                      bg="#1e1e1e", fg="#d4d4d4", insertbackground="white", state=tk.DISABLED)
-text_area.pack(padx=20, pady=10, fill=tk.BOTH, expand=True)
-
-button_frame = tk.Frame(root, pady=10)
-button_frame.pack()
-
-copy_button = tk.Button(button_frame, text="Copy to Clipboard", command=copy_to_clipboard, state="disabled", font=default_font)
-copy_button.pack(side=tk.LEFT, padx=10)
-ToolTip(copy_button, "Copy the displayed output to clipboard")
-
-save_button = tk.Button(button_frame, text="Save to File", command=save_to_file, font=default_font)
-save_button.pack(side=tk.LEFT, padx=10)
-ToolTip(save_button, "Save the displayed output to a text file")
-
-status_label = tk.Label(root, text="No folder selected", font=("Segoe UI", 9), fg="gray")
-status_label.pack(pady=(0, 10))
-
-root.mainloop()
+                write_lines(render_lines(format_selected, folder_path, tree), f)
+
+        def on_error(error):
+            messagebox.showerror("Error", f"Failed to save file:\n{error}")
+
+        # Not run_task, saving carries on if another folder or format is picked meanwhile
+        save_tasks[:] = [task for task in save_tasks if not task.finished.is_set()]
+        save_tasks.append(BackgroundTask(root, save, lambda result: messagebox.showinfo(
+            "Saved", f"Output saved to {file_path}"), on_error=on_error))
+
+def format_name(value):
+    for name in FORMATS:
+        if name.lower() == value.lower():
+            return name
+    raise argparse.ArgumentTypeError(f"unknown format {value!r}, choose from {', '.join(FORMATS)}")
+
+def run_cli(args):
+    """Headless mode, prints (or saves) the tree in the chosen format without opening a window."""
+    if not os.path.isdir(args.folder):
+        print(f"Not a folder: {args.folder}", file=sys.stderr)
+        return 1
+
+    show_progress = not args.quiet and sys.stderr.isatty()
+    last_report = [0.0]
+
+    def report(count):
+        now = time.monotonic()
+        if now - last_report[0] > 0.2:
+            last_report[0] = now
+            print(f"\rScanning... {count:,} entries", end="", file=sys.stderr, flush=True)
+
+    folder_path = os.path.abspath(args.folder)
+    tree = scan_tree(folder_path, progress=report if show_progress else None)
+    if show_progress:
+        print("\r" + " " * 40 + "\r", end="", file=sys.stderr)
+    lines = render_lines(args.format, folder_path, tree)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            write_lines(lines, f)
+    else:
+        write_lines(lines, sys.stdout)
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Shows a folder's tree in various formats. "
+                                                 "Opens the GUI unless a folder is given.")
+    parser.add_argument("folder", nargs="?", help="Folder to print the tree of, without opening the GUI")
+    parser.add_argument("-f", "--format", type=format_name, default="Plaintext",
+                        help=f"Output format: {', '.join(FORMATS)} (default Plaintext)")
+    parser.add_argument("-o", "--output", help="File to save the output to instead of printing it")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Don't show scan progress")
+    args = parser.parse_args()
+    if args.folder is not None:
+        sys.exit(run_cli(args))
+
+    # GUI Setup
+    root = tk.Tk()
+    root.title("Folder Tree Viewer")
+    root.minsize(700, 600)
+
+    selected_folder = [None]
+    folder_tree_cache = {"folder": None, "tree": None, "hash": None}
+    render_cache = RenderCache()
+    shown_output = {"lines": [], "start": 0}
+    folder_watcher = [None]
+    tasks = {"scan": None, "render": None}
+    save_tasks = []
+
+    # Use a nicer font for entire app
+    default_font = ("Segoe UI", 10)
+
+    frame = tk.Frame(root, padx=20, pady=10)
+    frame.pack(fill=tk.X)
+
+    btn_select = tk.Button(frame, text="Select Folder", command=select_folder, font=default_font)
+    btn_select.pack(side=tk.LEFT)
+    ToolTip(btn_select, "Select a folder to display its tree structure")
+
+    tk.Label(frame, text="Output Format:", font=default_font).pack(side=tk.LEFT, padx=(20, 5))
+
+    format_var = tk.StringVar(value="Plaintext")
+    for fmt in FORMATS:
+        rb = tk.Radiobutton(frame, text=fmt, variable=format_var, value=fmt, command=update_output, font=default_font)
+        rb.pack(side=tk.LEFT, padx=5)
+
+    text_area = scrolledtext.ScrolledText(root, wrap=tk.WORD, width=90, height=30, font=("Consolas", 11),
+                                          bg="#1e1e1e", fg="#d4d4d4", insertbackground="white", state=tk.DISABLED)
+    text_area.pack(padx=20, pady=(10, 0), fill=tk.BOTH, expand=True)
+
+    page_frame = tk.Frame(root)
+    page_frame.pack(fill=tk.X, padx=20)
+
+    prev_button = tk.Button(page_frame, text="◀ Previous", command=previous_page, state="disabled", font=default_font)
+    prev_button.pack(side=tk.LEFT)
+    next_button = tk.Button(page_frame, text="Next ▶", command=next_page, state="disabled", font=default_font)
+    next_button.pack(side=tk.RIGHT)
+    page_label = tk.Label(page_frame, text="", font=("Segoe UI", 9), fg="gray")
+    page_label.pack()
+    ToolTip(next_button, f"Large outputs are shown {PAGE_LINES:,} lines at a time")
+
+    button_frame = tk.Frame(root, pady=10)
+    button_frame.pack()
+
+    copy_button = tk.Button(button_frame, text="Copy to Clipboard", command=copy_to_clipboard, state="disabled", font=default_font)
+    copy_button.pack(side=tk.LEFT, padx=10)
+    ToolTip(copy_button, "Copy the displayed output to clipboard")
+
+    save_button = tk.Button(button_frame, text="Save to File", command=save_to_file, font=default_font)
+    save_button.pack(side=tk.LEFT, padx=10)
+    ToolTip(save_button, "Save the displayed output to a text file")
+
+    status_label = tk.Label(root, text="No folder selected", font=("Segoe UI", 9), fg="gray")
+    status_label.pack(pady=(0, 10))
+
+    root.mainloop()